@@ -0,0 +1,172 @@
+"""Bulk inventory operations for pharmacies.
+
+``import_medicines`` loads CSV or NDJSON uploads: rows are parsed lazily from
+the request stream, validated with ``MedicineSerializer`` and upserted a chunk
+at a time on the (pharmacy, name, dosage, expiry_date) batch key, so memory
+use depends on the chunk size rather than the upload size.
+
+``export_medicines`` is the reverse: it streams a queryset as CSV or NDJSON
+lines straight from a server-side iterator. Exported files can be imported
+again unchanged.
+"""
+import codecs
+import csv
+import json
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from . import cache as catalogue_cache
+from . import search
+from .models import Medicine, StockMovement
+from .serializers import MedicineSerializer
+
+MEDICINE_FIELDS = (
+    'name', 'generic_name', 'manufacturer', 'category', 'dosage', 'unit_price',
+    'stock_quantity', 'minimum_stock', 'expiry_date', 'description',
+)
+BATCH_KEY = ('name', 'dosage', 'expiry_date')
+EXPORT_FIELDS = ('id', *MEDICINE_FIELDS, 'updated_at')
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _text(stream):
+    # the request body is iterable line by line; decode lazily
+    return codecs.iterdecode(stream, 'utf-8-sig')
+
+
+def parse_csv(stream):
+    """Yield ``(row_number, record)`` pairs from a CSV stream with a header row."""
+    reader = csv.DictReader(_text(stream))
+    for number, record in enumerate(reader, start=1):
+        # empty cells mean "use the model default"
+        yield number, {k: v for k, v in record.items() if k and v not in (None, '')}
+
+
+def parse_ndjson(stream):
+    """Yield ``(row_number, record)`` pairs from newline-delimited JSON objects."""
+    number = 0
+    for line in _text(stream):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f'Invalid JSON: {exc}')
+            continue
+        if not isinstance(record, dict):
+            yield number, ValueError('Each line must be a JSON object')
+            continue
+        yield number, record
+
+
+def _upsert(pharmacy, rows):
+    """Insert or update one chunk of validated rows; return ``(created, updated)``."""
+    by_key = {}
+    for data in rows:
+        # the same batch twice in one chunk: last row wins, as it would row by row
+        by_key[tuple(data[f] for f in BATCH_KEY)] = data
+
+    objs = []
+    for data in by_key.values():
+        obj = Medicine(pharmacy=pharmacy, **data)
+        obj.set_availability()
+        objs.append(obj)
+
+    with transaction.atomic():
+        # locked, so a sale cannot slip in between this read and the import movement
+        existing = {
+            tuple(key): qty for *key, qty in
+            Medicine.objects.select_for_update().filter(pharmacy=pharmacy, name__in={k[0] for k in by_key})
+            .order_by('id').values_list(*BATCH_KEY, 'stock_quantity')
+        }
+        Medicine.objects.bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=['pharmacy', *BATCH_KEY],
+            update_fields=[f for f in MEDICINE_FIELDS if f not in BATCH_KEY] + ['is_available', 'updated_at'],
+        )
+        ids = {
+            tuple(key): pk for pk, *key in Medicine.objects.filter(pharmacy=pharmacy, name__in={k[0] for k in by_key})
+            .values_list('id', *BATCH_KEY)
+            if tuple(key) in by_key
+        }
+        StockMovement.objects.bulk_create([
+            StockMovement(medicine_id=pk, kind='import', quantity=by_key[key]['stock_quantity'] - existing.get(key, 0))
+            for key, pk in ids.items()
+            if by_key[key]['stock_quantity'] != existing.get(key, 0)
+        ])
+        # rows that existed already changed under any client holding them
+        Medicine.objects.filter(id__in=[pk for key, pk in ids.items() if key in existing]).update(version=F('version') + 1)
+        search.reindex(list(ids.values()))
+        catalogue_cache.invalidate()
+
+    updated = sum(1 for key in by_key if key in existing)
+    return len(by_key) - updated, updated
+
+
+def import_medicines(pharmacy, records, chunk_size=IMPORT_CHUNK_SIZE):
+    """Validate and upsert ``(row_number, record)`` pairs for ``pharmacy``.
+
+    Invalid rows are skipped and reported; valid rows are written in chunks.
+    """
+    validator = MedicineSerializer()
+    summary = {'rows': 0, 'created': 0, 'updated': 0, 'errors': []}
+    chunk = []
+
+    def flush():
+        created, updated = _upsert(pharmacy, chunk)
+        summary['created'] += created
+        summary['updated'] += updated
+        chunk.clear()
+
+    for number, record in records:
+        summary['rows'] += 1
+        if isinstance(record, Exception):
+            summary['errors'].append({'row': number, 'errors': {'non_field_errors': [str(record)]}})
+            continue
+        record = {k: v for k, v in record.items() if k in MEDICINE_FIELDS}
+        try:
+            data = validator.run_validation(record)
+        except Exception as exc:
+            detail = getattr(exc, 'detail', None)
+            summary['errors'].append({'row': number, 'errors': detail if detail is not None else {'non_field_errors': [str(exc)]}})
+            continue
+        chunk.append(data)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return summary
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    # full-precision ISO timestamps, so an exported updated_at can be fed back as updated_since
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def export_medicines(queryset, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield ``queryset`` as CSV (with a header row) or NDJSON, one line at a time."""
+    rows = queryset.order_by('updated_at', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow([_plain(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(EXPORT_FIELDS, map(_plain, row)))) + '\n'
@@ -0,0 +1,104 @@
+"""Response cache for the anonymous/patient medicine catalogue.
+
+Entries are keyed by role, normalized search term, coarse location tile,
+page and the database fingerprint the response's ETag is built from, plus a
+catalogue version number kept in the cache itself. The fingerprint means an
+entry is never served once the rows behind it changed, even when the change
+was made by another process whose ``invalidate()`` this one never saw. Any write that
+can change what patients see calls ``invalidate()``, which bumps the version
+and orphans every existing entry at once (they age out after
+``CATALOGUE_CACHE_TIMEOUT``). Because the version lives in the configured
+Django cache, invalidation reaches every worker when a shared backend
+(Redis, Memcached) is configured; with the default LocMemCache it is per
+process.
+"""
+import hashlib
+import json
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .spatial import haversine_km
+
+VERSION_KEY = 'catalogue:version'
+HITS_KEY = 'catalogue:hits'
+MISSES_KEY = 'catalogue:misses'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            return None
+
+
+def version():
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # start from the clock so entries written under an evicted version are never reused
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def _bump():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate():
+    """Drop every cached catalogue response once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def tile(lat, lon):
+    size = getattr(settings, 'CATALOGUE_CACHE_TILE_DEGREES', 0.02)
+    return (math.floor(lat / size), math.floor(lon / size))
+
+
+def tile_center(key):
+    """Return ``(lat, lon, margin_km)``: the tile's center and its center-to-corner distance."""
+    size = getattr(settings, 'CATALOGUE_CACHE_TILE_DEGREES', 0.02)
+    lat, lon = (key[0] + 0.5) * size, (key[1] + 0.5) * size
+    margin = max(
+        haversine_km(lat, lon, lat + size / 2, lon + size / 2),
+        haversine_km(lat, lon, lat - size / 2, lon + size / 2),
+    )
+    return lat, lon, margin
+
+
+def key(role, search, tile_key=None, radius=None, cursor=None, limit=None, state=None):
+    normalized = ' '.join((search or '').lower().split())
+    raw = json.dumps([role, normalized, tile_key, radius, cursor, limit, state], default=str)
+    return f'catalogue:{version()}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def lookup(cache_key):
+    value = cache.get(cache_key)
+    _incr(MISSES_KEY if value is None else HITS_KEY)
+    return value
+
+
+def store(cache_key, value):
+    cache.set(cache_key, value, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 60))
+
+
+def stats():
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else 0.0,
+        'version': version(),
+    }
@@ -0,0 +1,62 @@
+"""Conditional GET (ETag / If-None-Match) helpers for the inventory read endpoints.
+
+ETags are derived from a cheap fingerprint of the data behind a response,
+normally ``Max('updated_at')`` plus the row count of the underlying queryset,
+combined with the requesting user and the full request path. A matching
+``If-None-Match`` is answered with 304 before anything is serialized.
+
+Writers that bypass ``save()`` (``QuerySet.update()``) must bump
+``updated_at`` themselves, otherwise clients keep their cached copy.
+
+Unsafe methods can send the ETag back in ``If-Match``; ``precondition_met``
+tells the view whether the client edited the current representation.
+"""
+import hashlib
+import json
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def fingerprint(queryset):
+    """One aggregate query summarizing every row of ``queryset``."""
+    summary = queryset.order_by().aggregate(last=Max('updated_at'), count=Count('id'))
+    return [summary['last'], summary['count']]
+
+
+def make_etag(request, *parts):
+    raw = json.dumps([getattr(request.user, 'pk', None), request.get_full_path(), *parts], default=str)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """Return a 304 response if the client already holds ``etag``, else None."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    tags = _tags(header)
+    if '*' in tags or etag in tags:
+        return tagged(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def _tags(header):
+    return [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(header)]
+
+
+def precondition_met(request, etag):
+    """False if the request carries an If-Match that does not name ``etag``."""
+    header = request.headers.get('If-Match')
+    if not header:
+        return True
+    tags = _tags(header)
+    return '*' in tags or etag in tags
+
+
+def tagged(response, etag):
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,74 @@
+"""Customer identity: normalized email / phone keys and duplicate merging.
+
+Customers are matched on ``email_lower`` (trimmed, lowercased email) and then
+on ``phone_digits`` (the phone number with everything but digits removed).
+Both columns carry partial unique constraints, so a lookup is one index probe
+and ``get_or_create`` on them is safe against concurrent inserts.
+
+``backfill`` takes the model classes as arguments so that migration 0018 can
+run it on historical models; ``manage.py dedupe_customers`` runs it on the
+live ones.
+"""
+import re
+
+from django.db import transaction
+
+KEY_FIELDS = ('email_lower', 'phone_digits')
+
+
+def normalize_email(email):
+    return (email or '').strip().lower() or None
+
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', str(phone or '')) or None
+
+
+def backfill(Customer, Sale, chunk_size=1000):
+    """Fill in stale email_lower / phone_digits keys a chunk at a time.
+
+    A customer whose key already belongs to another customer is merged into
+    that one instead: its sales are re-pointed and the row is deleted. Returns
+    ``(updated, merged)``.
+    """
+    updated = merged = 0
+    last_id = 0
+    while True:
+        rows = list(Customer.objects.filter(id__gt=last_id).order_by('id').only('id', 'email', 'phone', 'email_lower', 'phone_digits')[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1].id
+        stale = []
+        for customer in rows:
+            keys = (normalize_email(customer.email), normalize_phone(customer.phone))
+            if (customer.email_lower, customer.phone_digits) != keys:
+                customer.email_lower, customer.phone_digits = keys
+                stale.append(customer)
+        if not stale:
+            continue
+
+        stale_ids = [customer.id for customer in stale]
+        owners = {}
+        for field in KEY_FIELDS:
+            values = {getattr(customer, field) for customer in stale} - {None}
+            owners.update(
+                ((field, value), pk) for pk, value in
+                Customer.objects.filter(**{f'{field}__in': values}).exclude(id__in=stale_ids).values_list('id', field)
+            )
+        keep, into = [], {}
+        for customer in stale:
+            target = next((owners[(f, getattr(customer, f))] for f in KEY_FIELDS if (f, getattr(customer, f)) in owners), None)
+            if target is None:
+                keep.append(customer)
+                owners.update(((f, getattr(customer, f)), customer.id) for f in KEY_FIELDS if getattr(customer, f))
+            else:
+                into[customer.id] = target
+
+        with transaction.atomic():
+            for target in set(into.values()):
+                Sale.objects.filter(customer_id__in=[pk for pk, t in into.items() if t == target]).update(customer_id=target)
+            Customer.objects.filter(id__in=list(into)).delete()
+            Customer.objects.bulk_update(keep, list(KEY_FIELDS))
+        updated += len(keep)
+        merged += len(into)
+    return updated, merged
@@ -0,0 +1,123 @@
+"""Idempotency-Key support for POST endpoints that must not run twice.
+
+A client that retries a request with the same ``Idempotency-Key`` header gets
+the stored response of the first attempt (with ``Idempotent-Replayed: true``)
+instead of a second order or a second stock decrement. Keys are scoped to the
+user and kept for ``IDEMPOTENCY_KEY_TTL`` seconds.
+
+The key is claimed with an INSERT before the view runs, so a retry that
+arrives while the first attempt is still running gets 409 rather than running
+in parallel. A claim still without a response after ``IDEMPOTENCY_LEASE``
+seconds is taken to belong to a worker that died, and the next retry takes it
+over. The view runs in one transaction with the update that stores its
+response, so a worker dying in between leaves neither behind, and a worker
+whose claim was taken over rolls its writes back. Server errors (5xx) are
+not stored; the client may retry them.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f'{request.method} {request.path}\n{body}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class _Superseded(Exception):
+    pass
+
+
+def _release(record):
+    """Drop our claim so the client can retry, unless another request has taken it over."""
+    IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at, response_status__isnull=True).delete()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Decorator for ``@api_view`` functions; place it below ``@permission_classes``."""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        digest = request_hash(request)
+        claimed = False
+        record = IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__gt=now).first()
+        if record is None:
+            # an expired record for the same key may still be waiting for the purge
+            IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__lte=now).delete()
+            ttl = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, key=key, request_hash=digest, expires_at=now + ttl)
+                claimed = True
+            except IntegrityError:
+                record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                if record is None:
+                    return Response({'error': 'Request with this Idempotency-Key is still being processed'}, status=status.HTTP_409_CONFLICT)
+        elif record.response_status is None and record.request_hash == digest:
+            lease = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE', 120))
+            if record.created_at <= now - lease:
+                # the worker holding the claim died mid-request; take it over (only one retry can)
+                claimed = IdempotencyKey.objects.filter(
+                    pk=record.pk, response_status__isnull=True, created_at=record.created_at,
+                ).update(created_at=now) == 1
+                if claimed:
+                    record.created_at = now
+
+        if claimed:
+            try:
+                # the response is stored in the view's own transaction, so a claim is never left
+                # without a response once the view's writes have committed
+                with transaction.atomic():
+                    response = view(request, *args, **kwargs)
+                    if response.status_code >= 500 or not isinstance(response, Response):
+                        _release(record)
+                        return response
+                    # store the body exactly as it was sent (decimals, dates) for replays
+                    body = json.loads(JSONRenderer().render(response.data) or 'null')
+                    stored = IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(
+                        response_status=response.status_code, response_body=body,
+                    )
+                    if not stored:
+                        # a retry took the claim over while this request ran too long; undo our writes
+                        raise _Superseded
+                    return response
+            except _Superseded:
+                return Response({'error': 'Request with this Idempotency-Key is still being processed'}, status=status.HTTP_409_CONFLICT)
+            except Exception:
+                _release(record)
+                raise
+
+        if record.request_hash != digest:
+            return Response({'error': f'{HEADER} was already used for a different request'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record.response_status is None:
+            return Response({'error': 'Request with this Idempotency-Key is still being processed'}, status=status.HTTP_409_CONFLICT)
+        return _replay(record)
+
+    return wrapper
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from inventory import stock
+from inventory.models import Medicine, StockMovement
+
+
+def _ledger_totals(ids):
+    return dict(
+        StockMovement.objects.filter(medicine_id__in=ids)
+        .values('medicine_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+        .values_list('medicine_id', 'total')
+    )
+
+
+class Command(BaseCommand):
+    help = 'Compare each medicine\'s stock_quantity with the sum of its StockMovement ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Medicines checked per pass')
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted stock_quantity values from the ledger')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = drifted = fixed = 0
+        last_id = 0
+        while True:
+            rows = list(Medicine.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'stock_quantity')[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            checked += len(rows)
+            ledger = _ledger_totals([pk for pk, _ in rows])
+            drift = {pk: ledger.get(pk, 0) for pk, qty in rows if ledger.get(pk, 0) != qty}
+            for pk, qty in rows:
+                if pk in drift:
+                    self.stdout.write(self.style.WARNING(f'Medicine {pk}: stock_quantity={qty}, ledger={drift[pk]}'))
+            drifted += len(drift)
+
+            if options['fix'] and drift:
+                with transaction.atomic():
+                    # re-read both sides under the row locks so a sale made since the check is not overwritten
+                    current = stock.lock(list(drift))
+                    ledger = _ledger_totals(list(current))
+                    # a negative ledger total cannot become stock; leave those for a human
+                    levels = {pk: ledger.get(pk, 0) for pk, qty in current.items() if ledger.get(pk, 0) != qty and ledger.get(pk, 0) >= 0}
+                    if levels:
+                        stock.apply(levels=levels, movements=[])
+                fixed += len(levels)
+
+        summary = f'Checked {checked} medicines, {drifted} out of line with the ledger'
+        if options['fix']:
+            summary += f', {fixed} rewritten'
+        self.stdout.write(self.style.SUCCESS(summary))
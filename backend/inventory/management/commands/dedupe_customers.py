@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from inventory import customers
+from inventory.models import Customer, Sale
+
+
+class Command(BaseCommand):
+    help = 'Recompute normalized customer email/phone keys, merging customers that share one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Customers checked per pass')
+
+    def handle(self, *args, **options):
+        updated, merged = customers.backfill(Customer, Sale, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated keys of {updated} customers, merged {merged} duplicates'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from inventory import search
+
+
+class Command(BaseCommand):
+    help = 'Repopulate the medicine full-text search table from inventory_medicine'
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            self.stdout.write(self.style.WARNING('No search table on this database; nothing to rebuild'))
+            return
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
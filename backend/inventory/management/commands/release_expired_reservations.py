@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import workflow
+
+
+class Command(BaseCommand):
+    help = 'Cancel approved orders the patient did not accept within ORDER_RESERVATION_TTL and return their stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None, help='Reservation lifetime in seconds (default: ORDER_RESERVATION_TTL)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Orders released per transaction')
+        parser.add_argument('--interval', type=float, default=None, help='Keep running, sweeping every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            released = workflow.release_expired(ttl=options['ttl'], chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations'))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
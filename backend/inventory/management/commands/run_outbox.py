@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbox emails; runs until stopped unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due emails once and exit (for cron)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent per SMTP connection')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when nothing is due')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = outbox.dispatch(batch_size=options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent + failed >= options['batch_size']:
+                # a full batch: more mail is probably due
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed attempts'))
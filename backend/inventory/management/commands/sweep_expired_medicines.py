@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory import cache as catalogue_cache
+from inventory.models import Medicine
+
+
+class Command(BaseCommand):
+    help = 'Clear is_available on medicines that expired since the last run (schedule once a day)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows updated per UPDATE statement')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        today = timezone.localdate()
+        total = 0
+        while True:
+            ids = list(
+                Medicine.objects.filter(is_available=True, expiry_date__lt=today)
+                .order_by()
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            total += Medicine.objects.filter(id__in=ids).refresh_availability()
+        if total:
+            catalogue_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Marked {total} expired medicines unavailable'))
@@ -0,0 +1,55 @@
+from django.db import migrations, transaction
+from django.db.utils import DatabaseError
+
+SEARCH_FIELDS = ('name', 'generic_name', 'category')
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS inventory_medicine_fts "
+                    "USING fts5(name, generic_name, category, tokenize='trigram')"
+                )
+                cursor.execute(
+                    'INSERT INTO inventory_medicine_fts (rowid, name, generic_name, category) '
+                    'SELECT id, name, generic_name, category FROM inventory_medicine'
+                )
+        except DatabaseError:
+            # SQLite built without FTS5/trigram support: search falls back to icontains
+            pass
+    elif connection.vendor == 'postgresql':
+        try:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+                for field in SEARCH_FIELDS:
+                    cursor.execute(
+                        f'CREATE INDEX IF NOT EXISTS inventory_medicine_{field}_trgm '
+                        f'ON inventory_medicine USING gin (UPPER({field}) gin_trgm_ops)'
+                    )
+        except DatabaseError:
+            # pg_trgm unavailable (e.g. no privilege to create extensions)
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('DROP TABLE IF EXISTS inventory_medicine_fts')
+        elif connection.vendor == 'postgresql':
+            for field in SEARCH_FIELDS:
+                cursor.execute(f'DROP INDEX IF EXISTS inventory_medicine_{field}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_sale_customer'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_is_available(apps, schema_editor):
+    Medicine = apps.get_model('inventory', 'Medicine')
+    today = timezone.localdate()
+    available = models.Q(stock_quantity__gt=0) & (models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gte=today))
+    last_id = 0
+    while True:
+        ids = list(Medicine.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:1000])
+        if not ids:
+            break
+        Medicine.objects.filter(id__in=ids).filter(available).update(is_available=True)
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_medicine_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='is_available',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_is_available, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-created_at', 'id'], name='medicine_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['pharmacy'], name='medicine_available_pharm_idx'),
+        ),
+    ]
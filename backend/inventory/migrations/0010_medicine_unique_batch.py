@@ -0,0 +1,76 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def merge_duplicate_batches(apps, schema_editor):
+    """Fold rows sharing (pharmacy, name, dosage, expiry_date) into the oldest one.
+
+    Only true duplicates are merged: rows that also agree on manufacturer and
+    unit_price. Stock is summed into the surviving row and order items / sales
+    are re-pointed to it before the duplicates are deleted. If any batch key is
+    shared by rows that differ in manufacturer or price, nothing is changed and
+    the migration stops with the list of those rows, to be resolved by hand.
+    """
+    Medicine = apps.get_model('inventory', 'Medicine')
+    OrderItem = apps.get_model('inventory', 'OrderItem')
+    Sale = apps.get_model('inventory', 'Sale')
+    key = ('pharmacy_id', 'name', 'dosage', 'expiry_date')
+    today = timezone.localdate()
+    duplicates = list(
+        Medicine.objects.values(*key)
+        .annotate(rows=models.Count('id'), keep=models.Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+
+    conflicts = []
+    for dup in duplicates:
+        rows = list(
+            Medicine.objects.filter(**{f: dup[f] for f in key})
+            .order_by('id')
+            .values_list('id', 'manufacturer', 'unit_price')
+        )
+        if len({(manufacturer, price) for _, manufacturer, price in rows}) > 1:
+            conflicts.append(
+                f"pharmacy {dup['pharmacy_id']} {dup['name']!r} {dup['dosage']!r} {dup['expiry_date']}: "
+                + ', '.join(f'#{pk} ({manufacturer}, {price})' for pk, manufacturer, price in rows)
+            )
+    if conflicts:
+        raise RuntimeError(
+            'Medicines share a (pharmacy, name, dosage, expiry_date) batch but differ in manufacturer '
+            'or unit_price; rename or merge them before migrating:\n' + '\n'.join(conflicts)
+        )
+
+    for dup in duplicates:
+        extra = Medicine.objects.filter(**{f: dup[f] for f in key}).exclude(id=dup['keep'])
+        extra_ids = list(extra.values_list('id', flat=True))
+        extra_stock = extra.aggregate(total=models.Sum('stock_quantity'))['total'] or 0
+        OrderItem.objects.filter(medicine_id__in=extra_ids).update(medicine_id=dup['keep'])
+        Sale.objects.filter(medicine_id__in=extra_ids).update(medicine_id=dup['keep'])
+        Medicine.objects.filter(id__in=extra_ids).delete()
+        kept = Medicine.objects.get(id=dup['keep'])
+        kept.stock_quantity += extra_stock
+        kept.is_available = kept.stock_quantity > 0 and kept.expiry_date >= today
+        kept.save(update_fields=['stock_quantity', 'is_available'])
+
+
+class Migration(migrations.Migration):
+    # the data fix and the ALTER TABLE run in separate transactions (PostgreSQL
+    # refuses to alter a table with pending FK trigger events)
+    atomic = False
+
+    dependencies = [
+        ('inventory', '0009_medicine_is_available'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_batches, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='medicine',
+            constraint=models.UniqueConstraint(fields=('pharmacy', 'name', 'dosage', 'expiry_date'), name='unique_medicine_batch'),
+        ),
+    ]
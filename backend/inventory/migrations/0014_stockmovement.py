@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    """Start every medicine's ledger with its current stock."""
+    Medicine = apps.get_model('inventory', 'Medicine')
+    StockMovement = apps.get_model('inventory', 'StockMovement')
+    last_id = 0
+    while True:
+        rows = list(Medicine.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'stock_quantity')[:1000])
+        if not rows:
+            break
+        StockMovement.objects.bulk_create([
+            StockMovement(medicine_id=pk, kind='opening', quantity=qty) for pk, qty in rows if qty
+        ])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('import', 'Import'), ('adjustment', 'Adjustment'), ('sale', 'Sale'), ('reservation', 'Reservation'), ('release', 'Release')], max_length=20)),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.medicine')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='inventory.order')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['medicine', 'id'], name='stockmovement_medicine_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
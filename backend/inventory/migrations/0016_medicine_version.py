@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_order_reservation_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:19
+
+from django.db import migrations, models
+
+from inventory import customers
+
+
+def dedupe_customers(apps, schema_editor):
+    """Fill the new identity columns and merge customers that share one."""
+    customers.backfill(apps.get_model('inventory', 'Customer'), apps.get_model('inventory', 'Sale'))
+
+
+class Migration(migrations.Migration):
+    # same split as 0010: the merge commits before the unique indexes are built
+    atomic = False
+
+    dependencies = [
+        ('inventory', '0017_sale_client_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='email_lower',
+            field=models.CharField(blank=True, editable=False, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_digits',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(dedupe_customers, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(condition=models.Q(('email_lower__isnull', False)), fields=('email_lower',), name='unique_customer_email'),
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(condition=models.Q(('phone_digits__isnull', False)), fields=('phone_digits',), name='unique_customer_phone'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_customer_identity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['pharmacy', 'sale_date', 'id'], name='sale_pharmacy_date_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .customers import normalize_email, normalize_phone
 
 User = settings.AUTH_USER_MODEL
 
@@ -22,22 +25,60 @@ class Customer(models.Model):
     name = models.CharField(max_length=200, blank=True)
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # normalized lookup keys, maintained by save(); see inventory.customers
+    email_lower = models.CharField(max_length=254, null=True, blank=True, editable=False)
+    phone_digits = models.CharField(max_length=20, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=['email_lower'], condition=models.Q(email_lower__isnull=False), name='unique_customer_email'),
+            models.UniqueConstraint(fields=['phone_digits'], condition=models.Q(phone_digits__isnull=False), name='unique_customer_phone'),
+        ]
 
     def __str__(self):
         return self.email or self.name or f"Customer {self.pk}"
+
+    def save(self, *args, **kwargs):
+        self.email_lower = normalize_email(self.email)
+        self.phone_digits = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + [f for f in ('email_lower', 'phone_digits') if f not in update_fields]
+        super().save(*args, **kwargs)
+def _availability_q(today):
+    return models.Q(stock_quantity__gt=0) & (models.Q(expiry_date__isnull=True) | models.Q(expiry_date__gte=today))
+
+
 class MedicineQuerySet(models.QuerySet):
     def available_for_patient(self):
         """
         Return medicines that are in stock and not expired.
         Keeps items with expiry_date == None.
+        Uses the indexed is_available flag; the expiry check covers rows that
+        expired since the last sweep_expired_medicines run.
         """
         today = timezone.localdate()
         expired_q = models.Q(expiry_date__isnull=False) & models.Q(expiry_date__lt=today)
-        return self.filter(stock_quantity__gt=0).exclude(expired_q)
+        return self.filter(is_available=True).exclude(expired_q)
+
+    def refresh_availability(self):
+        """Correct is_available on the rows of the queryset where it is out of date.
+
+        Only rows whose flag changes are written, and like every other writer
+        they get a new updated_at and version. Returns the number of rows changed.
+        """
+        available = _availability_q(timezone.localdate())
+        bumps = {'updated_at': timezone.now(), 'version': models.F('version') + 1}
+        return (
+            self.filter(is_available=True).exclude(available).update(is_available=False, **bumps)
+            + self.filter(is_available=False).filter(available).update(is_available=True, **bumps)
+        )
+
+class StaleMedicineError(Exception):
+    """Medicine.save() found the row at a different version than the one loaded."""
+
 
 class Medicine(models.Model):
     pharmacy = models.ForeignKey(User, on_delete=models.CASCADE, related_name='medicines')
@@ -51,16 +92,71 @@ class Medicine(models.Model):
     minimum_stock = models.IntegerField(default=50)
     expiry_date = models.DateField()
     description = models.TextField(blank=True)
+    # denormalized "in stock and not expired", maintained by save() and the expiry sweep
+    is_available = models.BooleanField(default=False, editable=False)
+    # bumped by every write; save() only overwrites the version it loaded
+    version = models.PositiveIntegerField(default=1, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Medicines'
+        constraints = [
+            # one row per stock batch; bulk import upserts on this key
+            models.UniqueConstraint(fields=['pharmacy', 'name', 'dosage', 'expiry_date'], name='unique_medicine_batch'),
+        ]
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], condition=models.Q(is_available=True), name='medicine_available_idx'),
+            models.Index(fields=['pharmacy'], condition=models.Q(is_available=True), name='medicine_available_pharm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.dosage}"
 
+    # stock and version as last read from / written to the database; None for unsaved medicines
+    _loaded_stock = None
+    _loaded_version = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock_quantity')
+        instance._loaded_version = instance.__dict__.get('version')
+        return instance
+
+    def set_availability(self):
+        """Recompute is_available; call this before writes that bypass save()."""
+        expiry = self.expiry_date
+        if isinstance(expiry, str):
+            expiry = parse_date(expiry)
+        self.is_available = self.stock_quantity > 0 and (expiry is None or expiry >= timezone.localdate())
+
+    def save(self, *args, **kwargs):
+        """Save, raising StaleMedicineError if the row changed since it was loaded."""
+        self.set_availability()
+        if self._loaded_version is not None:
+            self.version = self._loaded_version + 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = list(update_fields) + [f for f in ('is_available', 'version') if f not in update_fields]
+        super().save(*args, **kwargs)
+        self._loaded_stock = self.stock_quantity
+        self._loaded_version = self.version
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if self._loaded_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        # compare-and-set: UPDATE ... WHERE id = %s AND version = <loaded version>
+        if not base_qs.filter(pk=pk_val, version=self._loaded_version)._update(values):
+            raise StaleMedicineError(f'Medicine {pk_val} was changed by another request')
+        return True
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_stock = self.__dict__.get('stock_quantity')
+        self._loaded_version = self.__dict__.get('version')
+
     @property
     def is_low_stock(self):
         return self.stock_quantity <= self.minimum_stock
@@ -81,7 +177,19 @@ class Sale(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
     quantity = models.IntegerField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    sale_date = models.DateTimeField(auto_now_add=True)
+    # a default rather than auto_now_add, so offline sales keep the time they were rung up
+    sale_date = models.DateTimeField(default=timezone.now)
+    # id the point of sale gave an offline sale; sync_sales skips ids it has seen
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pharmacy', 'client_id'], condition=models.Q(client_id__isnull=False), name='unique_sale_client_id'),
+        ]
+        indexes = [
+            # pharmacy_sales: a pharmacy's history by date, paged on (sale_date, id)
+            models.Index(fields=['pharmacy', 'sale_date', 'id'], name='sale_pharmacy_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.medicine.name} - {self.quantity} units"
@@ -90,6 +198,7 @@ class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('approved', 'Approved'),
+        ('accepted', 'Accepted'),
         ('rejected', 'Rejected'),
         ('shipped', 'Shipped'),
         ('delivered', 'Delivered'),
@@ -109,10 +218,31 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # release_expired_reservations: approved orders still holding stock, oldest first
+            models.Index(fields=['status', 'stock_reserved', 'updated_at'], name='order_reservation_idx'),
+        ]
+
+    # status as last read from / written to the database; None for unsaved orders
+    _loaded_status = None
 
     def __str__(self):
         return f"Order {self.id} - {self.customer_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_status = self.__dict__.get('status')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
@@ -139,3 +269,87 @@ class Notification(models.Model):
 
     def __str__(self):
         return f"Notification to {self.recipient} - {self.verb}"
+
+
+class IdempotencyKey(models.Model):
+    """Response to a POST sent with an Idempotency-Key header, replayed when the client retries."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 of method, path and body; a reused key with a different request is refused
+    request_hash = models.CharField(max_length=64)
+    # both null while the first request is still being processed
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    # when the key was (last) claimed; a pending claim older than IDEMPOTENCY_LEASE is abandoned
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class OutboxEmail(models.Model):
+    """Email queued in the same transaction as the change it reports; sent by manage.py run_outbox."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+
+class StockMovement(models.Model):
+    """Append-only audit record of every change to Medicine.stock_quantity.
+
+    A medicine's movements add up to its stock_quantity; manage.py
+    check_stock_ledger verifies that (and restores it with --fix). Movements
+    are written next to the stock update, never instead of it; see
+    ``inventory.stock``.
+    """
+    KIND_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('import', 'Import'),
+        ('adjustment', 'Adjustment'),
+        ('sale', 'Sale'),
+        ('reservation', 'Reservation'),
+        ('release', 'Release'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['medicine', 'id'], name='stockmovement_medicine_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.quantity:+d} of medicine {self.medicine_id}"
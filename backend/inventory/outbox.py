@@ -0,0 +1,90 @@
+"""Transactional email outbox.
+
+Request handlers call ``enqueue`` instead of ``send_mail``: it only INSERTs an
+OutboxEmail row, inside whatever transaction the caller is in, so the email
+exists exactly when the change it describes was committed and the request
+never waits on SMTP. ``dispatch`` (run by ``manage.py run_outbox``) sends due
+rows in batches over one reused connection, with no database transaction
+held during SMTP, and reschedules failures with exponential backoff until
+``OUTBOX_MAX_ATTEMPTS`` is reached.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+
+def enqueue(subject, body, recipients, from_email=None):
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or '',
+        recipients=list(recipients),
+    )
+
+
+def _backoff(attempts):
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def dispatch(batch_size=100, connection=None):
+    """Send one batch of due emails; return ``(sent, failed)`` counts.
+
+    The batch is leased in one short transaction (its next_attempt_at pushed
+    ``OUTBOX_LEASE`` seconds ahead), sent with no transaction open, and the
+    results recorded in a second short transaction. Rows of a worker that dies
+    mid-batch become due again when the lease runs out.
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        due = OutboxEmail.objects.filter(status='pending', next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if db_connection.features.has_select_for_update_skip_locked:
+            # several workers can run side by side without sending twice
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0, 0
+        OutboxEmail.objects.filter(pk__in=ids, status='pending', next_attempt_at__lte=now).update(next_attempt_at=lease_until)
+    # without SKIP LOCKED another worker may have leased some of them first
+    batch = list(OutboxEmail.objects.filter(pk__in=ids, next_attempt_at=lease_until).order_by('id'))
+
+    connection = connection or get_connection()
+    sent, failed = [], []
+    try:
+        connection.open()
+    except Exception as e:
+        failed = [(email, e) for email in batch]
+    else:
+        try:
+            for email in batch:
+                message = EmailMessage(email.subject, email.body, email.from_email or None, email.recipients, connection=connection)
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failed.append((email, e))
+                else:
+                    sent.append(email.pk)
+        finally:
+            connection.close()
+
+    finished = timezone.now()
+    for email, error in failed:
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= max_attempts:
+            email.status = 'failed'
+        else:
+            email.next_attempt_at = finished + _backoff(email.attempts)
+    with transaction.atomic():
+        if sent:
+            OutboxEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=finished, last_error='')
+        if failed:
+            OutboxEmail.objects.bulk_update([email for email, _ in failed], ['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return len(sent), len(failed)
@@ -0,0 +1,142 @@
+"""Keyset (cursor) pagination helpers for the inventory list endpoints.
+
+Pagination is opt-in so existing clients keep getting a plain list: when a
+request carries ``limit`` or ``cursor`` the endpoint answers with
+``{'results': [...], 'next': <cursor or None>}`` instead. Cursors are opaque
+url-safe tokens holding the sort key of the last row on the previous page.
+"""
+import base64
+import json
+from bisect import bisect_left
+from numbers import Real
+
+from django.core.exceptions import ValidationError
+from django.db.models import Case, IntegerField, Q, Value, When
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def wants_page(request):
+    return 'limit' in request.query_params or 'cursor' in request.query_params
+
+
+def page_limit(request):
+    try:
+        limit = int(request.query_params.get('limit') or DEFAULT_PAGE_SIZE)
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the list of sort values stored in ``token``; raises ValueError if malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _sort_field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    return annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+
+
+def _cursor_values(queryset, ordering, values):
+    """Coerce cursor ``values`` to the types of the ``ordering`` fields; raises ValueError."""
+    if len(values) != len(ordering):
+        raise ValueError('Invalid cursor')
+    coerced = []
+    for field, value in zip(ordering, values):
+        try:
+            value = _sort_field(queryset, field.lstrip('-')).to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+        if value is None:
+            raise ValueError('Invalid cursor')
+        coerced.append(value)
+    return coerced
+
+
+def _after(ordering, values):
+    """Build the lexicographic "comes after ``values``" filter for ``ordering``."""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        branch = Q(**{f'{name}__{lookup}': values[i]})
+        for prev, value in zip(ordering[:i], values[:i]):
+            branch &= Q(**{prev.lstrip('-'): value})
+        condition |= branch
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor, limit):
+    """Return ``(rows, next_cursor)`` for the page after ``cursor``.
+
+    ``ordering`` must end in a unique field (normally ``id``) so every row has
+    a distinct position. Works for model instances and ``.values()`` dicts.
+    """
+    values = decode_cursor(cursor)
+    queryset = queryset.order_by(*ordering)
+    if values is not None:
+        queryset = queryset.filter(_after(ordering, _cursor_values(queryset, ordering, values)))
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    key = [last[f.lstrip('-')] if isinstance(last, dict) else getattr(last, f.lstrip('-')) for f in ordering]
+    return rows, encode_cursor(key)
+
+
+def _is_number(value):
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+def _group_key(sort_value, group):
+    return (sort_value is None, sort_value or 0, group)
+
+
+def ranked_page(queryset, field, sort_values, cursor, limit):
+    """Page over ``queryset`` ordered by a per-group sort value computed in Python.
+
+    ``field`` names the column rows are grouped by (e.g. ``pharmacy_id``) and
+    ``sort_values`` maps each of its values to a sort value; ``None`` sorts
+    last. Only the groups are ranked in Python; the database orders rows by
+    that rank and then ``id``, so a request loads one page whatever the size
+    of ``queryset``. Returns ``(rows, next_cursor)`` of ``.values()`` dicts.
+    """
+    values = decode_cursor(cursor)
+    groups = sorted(sort_values, key=lambda group: _group_key(sort_values[group], group))
+    rank = Case(
+        *[When(**{field: group}, then=Value(i)) for i, group in enumerate(groups)],
+        default=Value(len(groups)), output_field=IntegerField(),
+    )
+    queryset = queryset.annotate(group_rank=rank).order_by('group_rank', 'id').values('id', field, 'group_rank')
+    if values is not None:
+        if len(values) != 3 or not (values[0] is None or _is_number(values[0])) or not all(_is_number(v) for v in values[1:]):
+            raise ValueError('Invalid cursor')
+        key = _group_key(*values[:2])
+        position = bisect_left([_group_key(sort_values[group], group) for group in groups], key)
+        if position < len(groups) and _group_key(sort_values[groups[position]], groups[position]) == key:
+            queryset = queryset.filter(Q(group_rank__gt=position) | Q(group_rank=position, id__gt=values[2]))
+        else:
+            queryset = queryset.filter(group_rank__gte=position)
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([sort_values.get(last[field]), last[field], last['id']])
@@ -0,0 +1,95 @@
+"""Resolve pharmacy users to the inventory ``Pharmacy`` their sales are booked to.
+
+The user -> inventory Pharmacy mapping almost never changes, yet the sales,
+dashboard and checkout endpoints all need it. ``resolve`` looks a user up in
+a small process-wide LRU, memoizes the answer on the request, and only then
+goes to the database, creating the row if asked to.
+
+Cached rows are dropped by the Pharmacy receivers in ``inventory.signals``.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+_MEMO_ATTR = '_inventory_pharmacies'
+
+
+class PharmacyResolver:
+    """LRU of user id -> inventory Pharmacy."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        ttl = getattr(settings, 'PHARMACY_INDEX_TTL', 300)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            pharmacy, stored_at = entry
+            if ttl and time.monotonic() - stored_at > ttl:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return pharmacy
+
+    def put(self, user_id, pharmacy):
+        with self._lock:
+            self._entries[user_id] = (pharmacy, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+pharmacy_resolver = PharmacyResolver()
+
+
+def _default_name(user):
+    uname = getattr(user, 'name', None) or getattr(user, 'username', None) or (getattr(user, 'email', '') or '').split('@')[0]
+    return f"{uname} Pharmacy"
+
+
+def resolve(user, request=None, create=True):
+    """The inventory Pharmacy of pharmacy ``user``, or None.
+
+    With ``create`` a missing row is created (named after the user), so the
+    caller never needs a fallback. Pass ``request`` to memoize the answer for
+    the rest of the request.
+    """
+    from .models import Pharmacy
+
+    memo = getattr(request, _MEMO_ATTR, None) if request is not None else None
+    if memo is not None and user.pk in memo:
+        return memo[user.pk]
+
+    pharmacy = pharmacy_resolver.get(user.pk)
+    if pharmacy is None:
+        pharmacy = Pharmacy.objects.filter(user_id=user.pk).first()
+        if pharmacy is None and create:
+            pharmacy, _ = Pharmacy.objects.get_or_create(
+                user_id=user.pk, defaults={'name': _default_name(user), 'address': '', 'phone': ''},
+            )
+        if pharmacy is not None:
+            # only cache rows that are committed; a rolled-back create must not linger
+            user_id, found = user.pk, pharmacy
+            transaction.on_commit(lambda: pharmacy_resolver.put(user_id, found))
+
+    if request is not None and pharmacy is not None:
+        if memo is None:
+            memo = {}
+            setattr(request, _MEMO_ATTR, memo)
+        memo[user.pk] = pharmacy
+    return pharmacy
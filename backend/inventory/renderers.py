@@ -0,0 +1,29 @@
+"""Renderers for the streaming export endpoints.
+
+DRF uses the ``format`` query parameter to pick a renderer, so these exist
+mainly to make ``?format=csv`` and ``?format=ndjson`` valid on those views.
+Export bodies are streamed by the view itself; ``render`` only has to cope
+with the small error payloads (403, 400, ...), which are written as JSON.
+"""
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class _ExportRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, default=str).encode(self.charset)
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
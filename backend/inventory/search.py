@@ -0,0 +1,104 @@
+"""Relevance-ranked medicine search.
+
+On SQLite the searchable columns are mirrored into an FTS5 table using the
+trigram tokenizer, so substring matches (what ``icontains`` gave us) are
+answered from the index and ranked with bm25. On PostgreSQL the columns carry
+pg_trgm GIN indexes, which serve the ``icontains`` lookups, and results are
+ranked by trigram similarity when the pg_trgm extension is installed (migration
+0008 tolerates it missing). Anything else, or terms shorter than a trigram,
+falls back to plain ``icontains``.
+
+Every backend annotates ``search_rank`` (higher is better) so callers can order
+or paginate on it. The FTS table is kept current by the Medicine post_save /
+post_delete receivers in ``inventory.signals``; code that writes medicines in
+bulk must call ``reindex()`` itself.
+"""
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'inventory_medicine_fts'
+SEARCH_FIELDS = ('name', 'generic_name', 'category')
+
+_fts_ready = None
+_trigram_ready = None
+
+
+def fts_available():
+    global _fts_ready
+    if connection.vendor != 'sqlite':
+        return False
+    if _fts_ready is None:
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+
+def trigram_available():
+    global _trigram_ready
+    if connection.vendor != 'postgresql':
+        return False
+    if _trigram_ready is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_ready = cursor.fetchone() is not None
+    return _trigram_ready
+
+
+def reindex(ids):
+    """Refresh the FTS rows of the given medicine ids (deleted ids are dropped)."""
+    ids = [int(i) for i in ids]
+    if not ids or not fts_available():
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', ids)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, generic_name, category) '
+            f'SELECT id, name, generic_name, category FROM inventory_medicine WHERE id IN ({placeholders})',
+            ids,
+        )
+
+
+def rebuild():
+    """Repopulate the whole FTS table from inventory_medicine."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, generic_name, category) '
+            'SELECT id, name, generic_name, category FROM inventory_medicine'
+        )
+
+
+def search(queryset, term, fields=SEARCH_FIELDS):
+    """Filter ``queryset`` to medicines matching ``term`` in ``fields``, best matches first."""
+    term = (term or '').strip()
+    if len(term) >= 3 and fts_available():
+        match = '{%s} : "%s"' % (' '.join(fields), term.replace('"', '""'))
+        weights = ', '.join('10.0' if f == 'name' else '1.0' for f in SEARCH_FIELDS)
+        table = queryset.model._meta.db_table
+        queryset = queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,))
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            (match,),
+            output_field=FloatField(),
+        ))
+        return queryset.order_by('-search_rank', '-id')
+
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': term})
+    queryset = queryset.filter(condition)
+    if len(term) >= 3 and trigram_available():
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+
+        similarities = [TrigramSimilarity(field, term) for field in fields]
+        rank = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        queryset = queryset.annotate(search_rank=rank)
+    else:
+        queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    return queryset.order_by('-search_rank', '-id')
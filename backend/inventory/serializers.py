@@ -14,19 +14,86 @@ class MedicineSerializer(serializers.ModelSerializer):
             'id', 'pharmacy', 'pharmacy_name', 'pharmacy_id', 'pharmacy_email',
             'name', 'generic_name', 'manufacturer', 'category', 'dosage',
             'unit_price', 'stock_quantity', 'minimum_stock', 'expiry_date',
-            'description', 'is_low_stock', 'created_at', 'updated_at'
+            'description', 'is_low_stock', 'version', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['pharmacy', 'pharmacy_name', 'pharmacy_id', 'pharmacy_email', 'created_at', 'updated_at']
+        read_only_fields = ['pharmacy', 'pharmacy_name', 'pharmacy_id', 'pharmacy_email', 'version', 'created_at', 'updated_at']
     def validate_stock_quantity(self, value):
         if value is not None and value < 0:
             raise serializers.ValidationError("stock_quantity cannot be negative")
         return value
 
+# values() lookups feeding the MedicineSerializer fields that do not map 1:1 to a column
+_MEDICINE_VALUE_SOURCES = {
+    'pharmacy': 'pharmacy_id',
+    'pharmacy_name': 'pharmacy__username',
+    'pharmacy_id': 'pharmacy_id',
+    'pharmacy_email': 'pharmacy__email',
+}
+
+
+def medicine_rows(queryset):
+    """Read-only fast path for ``MedicineSerializer(queryset, many=True).data``.
+
+    Fetches every row, pharmacy columns included, with a single joined
+    ``.values()`` query and formats each value with the serializer's own
+    fields, so the output is identical without building model instances.
+    """
+    fields = MedicineSerializer().fields
+    sources = {
+        name: _MEDICINE_VALUE_SOURCES.get(name, name)
+        for name in fields if name != 'is_low_stock'
+    }
+    lookups = list(dict.fromkeys([*sources.values(), 'stock_quantity', 'minimum_stock']))
+    rows = []
+    for values in queryset.values(*lookups):
+        row = {}
+        for name, field in fields.items():
+            if name == 'is_low_stock':
+                row[name] = values['stock_quantity'] <= values['minimum_stock']
+                continue
+            value = values[sources[name]]
+            if value is None or name == 'pharmacy':
+                row[name] = value
+            else:
+                row[name] = field.to_representation(value)
+        rows.append(row)
+    return rows
+
+
 class SellRequestSerializer(serializers.Serializer):
     medicine_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
     customer = serializers.DictField(child=serializers.CharField(), required=False)
 
+class SaleLineSerializer(serializers.Serializer):
+    medicine_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class BasketSaleSerializer(serializers.Serializer):
+    items = SaleLineSerializer(many=True, allow_empty=False, max_length=200)
+    customer_name = serializers.CharField(required=False, allow_blank=True)
+    customer_phone = serializers.CharField(required=False, allow_blank=True)
+    customer_email = serializers.EmailField(required=False, allow_blank=True)
+
+class OfflineSaleSerializer(SaleLineSerializer):
+    client_id = serializers.CharField(max_length=64)
+    sold_at = serializers.DateTimeField()
+    customer_name = serializers.CharField(required=False, allow_blank=True)
+    customer_phone = serializers.CharField(required=False, allow_blank=True)
+
+class SaleSyncSerializer(serializers.Serializer):
+    sales = OfflineSaleSerializer(many=True, allow_empty=False, max_length=1000)
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    delta = serializers.IntegerField(required=False)
+    absolute = serializers.IntegerField(required=False, min_value=0)
+
+    def validate(self, attrs):
+        if ('delta' in attrs) == ('absolute' in attrs):
+            raise serializers.ValidationError("Provide exactly one of delta or absolute")
+        return attrs
+
 class OrderItemSerializer(serializers.ModelSerializer):
     medicine = MedicineSerializer(read_only=True)
 
@@ -38,4 +105,12 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['id', 'pharmacy', 'patient', 'customer_name', 'customer_phone', 'total_amount', 'status', 'created_at', 'updated_at']
-        read_only_fields = ['pharmacy', 'patient', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['pharmacy', 'patient', 'created_at', 'updated_at']
+
+
+class OrderWithItemsSerializer(OrderSerializer):
+    """Order plus its line items; used by the order lists with ?expand=items."""
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        fields = OrderSerializer.Meta.fields + ['items']
\ No newline at end of file
@@ -1,8 +1,13 @@
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.db import transaction
 
-from .models import Order, OrderItem, Medicine
+from .models import Order, Medicine, Pharmacy, StockMovement
+from .spatial import pharmacy_index
+from .pharmacies import pharmacy_resolver
+from . import search
+from . import cache as catalogue_cache
+from . import stock
 
 
 def _display_name(user):
@@ -41,39 +46,60 @@ def reserve_stock_on_approval(sender, instance, **kwargs):
     """
     if not instance.pk:
         return
-
-    try:
-        old = Order.objects.get(pk=instance.pk)
-    except Order.DoesNotExist:
+    # the order endpoints reserve through inventory.workflow before saving, so this
+    # only does work for approvals made elsewhere (admin, serializer saves)
+    if instance.status != 'approved' or instance._loaded_status == 'approved' or instance.stock_reserved:
         return
-    if old.status == 'approved' or instance.status != 'approved':
-        return
-    if instance.stock_reserved:
+    with transaction.atomic():
+        stock.reserve(instance)
+        try:
+            from .models import Notification
+            if instance.patient:
+                Notification.objects.create(
+                    recipient=instance.patient,
+                    actor=None,
+                    verb='order_approved',
+                    message=f'Your order #{instance.id} has been approved by {_display_name(instance.pharmacy)}.',
+                    data={'order_id': instance.id}
+                )
+        except Exception:
+            pass
+
+
+@receiver(post_save, sender=Pharmacy)
+def index_pharmacy_location(sender, instance, **kwargs):
+    """Refresh the in-memory location index once the pharmacy row is committed."""
+    user_id, lat, lon = instance.user_id, instance.latitude, instance.longitude
+    transaction.on_commit(lambda: pharmacy_index.update(user_id, lat, lon))
+    transaction.on_commit(lambda: pharmacy_resolver.forget(user_id))
+    catalogue_cache.invalidate()
+
+
+@receiver(post_delete, sender=Pharmacy)
+def unindex_pharmacy_location(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: pharmacy_index.remove(user_id))
+    transaction.on_commit(lambda: pharmacy_resolver.forget(user_id))
+    catalogue_cache.invalidate()
+
+
+@receiver(post_save, sender=Medicine)
+def index_medicine_search(sender, instance, **kwargs):
+    search.reindex([instance.pk])
+    catalogue_cache.invalidate()
+
+
+@receiver(post_save, sender=Medicine)
+def record_stock_edit(sender, instance, created, update_fields=None, **kwargs):
+    """Ledger stock set directly through save() (create form, PATCH, admin)."""
+    if kwargs.get('raw') or (update_fields is not None and 'stock_quantity' not in update_fields):
         return
-    items = OrderItem.objects.filter(order=instance)
-    try:
-        with transaction.atomic():
-            for it in items.select_for_update():
-                med = Medicine.objects.select_for_update().get(pk=it.medicine.id)
-                if med.stock_quantity < it.quantity:
-                    raise ValueError(f'Insufficient stock for {med.name}')
-            for it in items:
-                med = Medicine.objects.select_for_update().get(pk=it.medicine.id)
-                med.stock_quantity = med.stock_quantity - it.quantity
-                med.save()
-            instance.stock_reserved = True
-            try:
-                from .models import Notification
-                if instance.patient:
-                    Notification.objects.create(
-                        recipient=instance.patient,
-                        actor=None,
-                        verb='order_approved',
-                        message=f'Your order #{instance.id} has been approved by {_display_name(instance.pharmacy)}.',
-                        data={'order_id': instance.id}
-                    )
-            except Exception:
-                pass
+    change = instance.stock_quantity - (0 if created else (instance._loaded_stock or 0))
+    if change:
+        StockMovement.objects.create(medicine=instance, kind='opening' if created else 'adjustment', quantity=change)
 
-    except Exception:
-        raise
+
+@receiver(post_delete, sender=Medicine)
+def unindex_medicine_search(sender, instance, **kwargs):
+    search.reindex([instance.pk])
+    catalogue_cache.invalidate()
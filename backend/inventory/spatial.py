@@ -0,0 +1,124 @@
+"""In-memory grid index of inventory pharmacy coordinates.
+
+``medicine_list`` needs the owning pharmacy's coordinates for every medicine it
+returns. Rather than querying ``Pharmacy`` once per row, the coordinates of all
+pharmacies are loaded once per process and bucketed into fixed-size lat/lon
+cells, so radius lookups only inspect the cells around the search point.
+
+The index is kept current by the ``Pharmacy`` post_save/post_delete receivers in
+``inventory.signals`` (which also fire for ``users.signals.sync_inventory_pharmacy``)
+and is rebuilt after ``PHARMACY_INDEX_TTL`` seconds so other worker processes
+eventually pick up changes they did not see.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in km."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * (math.sin(dlon / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class PharmacyIndex:
+    """Maps pharmacy user ids to coordinates, bucketed into grid cells."""
+
+    def __init__(self, cell_degrees=0.1):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.RLock()
+        self._coords = {}
+        self._cells = {}
+        self._built_at = None
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def _insert(self, user_id, lat, lon):
+        self._coords[user_id] = (lat, lon)
+        self._cells.setdefault(self._cell(lat, lon), set()).add(user_id)
+
+    def _discard(self, user_id):
+        old = self._coords.pop(user_id, None)
+        if old is None:
+            return
+        cell = self._cell(*old)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self._cells[cell]
+
+    def _ensure(self):
+        ttl = getattr(settings, 'PHARMACY_INDEX_TTL', 300)
+        built_at = self._built_at
+        if built_at is None or (ttl and time.monotonic() - built_at > ttl):
+            self.rebuild()
+
+    def rebuild(self):
+        """Reload every pharmacy's coordinates with a single query."""
+        from .models import Pharmacy
+
+        rows = Pharmacy.objects.values_list('user_id', 'latitude', 'longitude')
+        with self._lock:
+            self._coords = {}
+            self._cells = {}
+            for user_id, lat, lon in rows:
+                self._insert(user_id, float(lat or 0.0), float(lon or 0.0))
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def update(self, user_id, lat, lon):
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._discard(user_id)
+            self._insert(user_id, float(lat or 0.0), float(lon or 0.0))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._discard(user_id)
+
+    def coords(self, user_id):
+        """Return ``(lat, lon)`` for a pharmacy user id, or None if unknown."""
+        self._ensure()
+        return self._coords.get(user_id)
+
+    def within(self, lat, lon, radius_km):
+        """Return ``{user_id: distance_km}`` for pharmacies within ``radius_km``."""
+        self._ensure()
+        with self._lock:
+            dlat = radius_km / KM_PER_DEGREE
+            cos_lat = math.cos(math.radians(lat))
+            dlon = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-6 else 360.0
+            lat_lo, lon_lo = self._cell(lat - dlat, lon - dlon)
+            lat_hi, lon_hi = self._cell(lat + dlat, lon + dlon)
+            cell_count = (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1)
+            if lon - dlon < -180 or lon + dlon > 180 or cell_count > len(self._cells):
+                # very large radius or crossing the antimeridian: a full scan is cheaper
+                candidates = list(self._coords)
+            else:
+                candidates = []
+                for i in range(lat_lo, lat_hi + 1):
+                    for j in range(lon_lo, lon_hi + 1):
+                        candidates.extend(self._cells.get((i, j), ()))
+            result = {}
+            for user_id in candidates:
+                plat, plon = self._coords[user_id]
+                distance = haversine_km(lat, lon, plat, plon)
+                if distance <= radius_km:
+                    result[user_id] = distance
+            return result
+
+
+pharmacy_index = PharmacyIndex()
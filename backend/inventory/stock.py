@@ -0,0 +1,147 @@
+"""Set-based stock updates.
+
+``apply`` changes the stock of many medicines at once: the rows are locked in
+one query ordered by id (so concurrent writers always lock in the same order
+and cannot deadlock), then a single UPDATE applies every change through a CASE
+over ``F('stock_quantity')``. The UPDATE repeats the non-negative check in its
+WHERE clause, so a change that would take stock below zero matches no row and
+the whole batch is rolled back.
+
+Each change is also appended to the StockMovement ledger in the same
+transaction (one bulk INSERT), so the history of a medicine's stock can be
+audited and its snapshot rebuilt by ``manage.py check_stock_ledger``. The
+ledger is an audit trail only: ``stock_quantity`` stays the authoritative
+count, and every change still locks and updates the Medicine row. Taking
+sales off that row would mean deferring the non-negative check, which
+cannot be done without the lock, so the hot row is kept on purpose.
+
+``reserve`` and ``release`` move an order's items out of and back into stock
+on top of ``apply``; the order's ``stock_reserved`` flag is flipped with a
+conditional UPDATE first, so an order is never reserved or released twice.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from . import cache as catalogue_cache
+from .models import Medicine, Order, OrderItem, StockMovement
+
+
+class StockError(ValueError):
+    """A stock change could not be applied; ``medicine_ids`` lists the offending rows."""
+
+    def __init__(self, message, medicine_ids=()):
+        super().__init__(message)
+        self.medicine_ids = sorted(medicine_ids)
+
+
+def lock(ids, **filters):
+    """Lock the given medicines in id order and return ``{id: stock_quantity}``."""
+    return dict(
+        Medicine.objects.select_for_update()
+        .filter(id__in=ids, **filters)
+        .order_by('id')
+        .values_list('id', 'stock_quantity')
+    )
+
+
+def apply(deltas=None, levels=None, kind='adjustment', order=None, movements=None, **filters):
+    """Apply stock changes in one UPDATE and return ``{id: new_stock_quantity}``.
+
+    ``deltas`` maps medicine id to a signed change, ``levels`` maps medicine id
+    to an absolute quantity. ``filters`` restrict which rows may be touched
+    (e.g. ``pharmacy=user``). Raises StockError if a medicine is missing or
+    would go negative; nothing is written in that case.
+
+    One ``kind`` movement per medicine (linked to ``order``) is written to the
+    ledger, unless the caller passes its own unsaved ``movements``.
+    """
+    deltas = dict(deltas or {})
+    levels = dict(levels or {})
+    ids = set(deltas) | set(levels)
+    if not ids:
+        return {}
+
+    with transaction.atomic():
+        current = lock(ids, **filters)
+        missing = ids - set(current)
+        if missing:
+            raise StockError('Medicine not found', missing)
+
+        quantities = {pk: levels[pk] if pk in levels else current[pk] + deltas[pk] for pk in ids}
+        negative = [pk for pk, qty in quantities.items() if qty < 0]
+        if negative:
+            raise StockError('Insufficient stock', negative)
+
+        whens, guard = [], Q()
+        for pk in sorted(ids):
+            if pk in levels:
+                whens.append(When(id=pk, then=Value(levels[pk])))
+                guard |= Q(id=pk)
+            else:
+                whens.append(When(id=pk, then=F('stock_quantity') + deltas[pk]))
+                guard |= Q(id=pk, stock_quantity__gte=-deltas[pk]) if deltas[pk] < 0 else Q(id=pk)
+        new_stock = Case(*whens, default=F('stock_quantity'), output_field=IntegerField())
+        today = timezone.localdate()
+        updated = Medicine.objects.filter(guard).update(
+            stock_quantity=new_stock,
+            is_available=Case(
+                When(
+                    Q(GreaterThan(new_stock, 0)) & (Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)),
+                    then=Value(True),
+                ),
+                default=Value(False),
+            ),
+            version=F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if updated != len(ids):
+            # another writer got in between; treat it like running out of stock
+            raise StockError('Insufficient stock', ids)
+        if movements is None:
+            movements = [
+                StockMovement(medicine_id=pk, kind=kind, quantity=quantities[pk] - current[pk], order=order)
+                for pk in sorted(ids)
+            ]
+        StockMovement.objects.bulk_create([m for m in movements if m.quantity])
+        catalogue_cache.invalidate()
+    return quantities
+
+
+def _order_quantities(order):
+    """``{medicine_id: total quantity}`` over the order's items."""
+    return dict(
+        OrderItem.objects.filter(order=order)
+        .values('medicine_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+        .values_list('medicine_id', 'total')
+    )
+
+
+def reserve(order, kind='reservation'):
+    """Take the order's items out of stock and mark it ``stock_reserved``.
+
+    Does nothing if the order is already reserved. Raises StockError, naming
+    the medicines that ran short, if any item cannot be covered. ``kind`` is
+    the ledger entry written ('sale' when stock leaves on delivery).
+    """
+    with transaction.atomic():
+        claimed = Order.objects.filter(pk=order.pk, stock_reserved=False).update(stock_reserved=True, updated_at=timezone.now())
+        if claimed:
+            try:
+                apply(deltas={pk: -qty for pk, qty in _order_quantities(order).items()}, kind=kind, order=order)
+            except StockError as e:
+                names = Medicine.objects.filter(id__in=e.medicine_ids).order_by('id').values_list('name', flat=True)
+                raise StockError(f'Insufficient stock for {", ".join(names) or "this order"}', e.medicine_ids)
+    order.stock_reserved = True
+
+
+def release(order):
+    """Put a reserved order's items back into stock; a no-op if nothing is reserved."""
+    with transaction.atomic():
+        claimed = Order.objects.filter(pk=order.pk, stock_reserved=True).update(stock_reserved=False, updated_at=timezone.now())
+        if claimed:
+            apply(deltas=_order_quantities(order), kind='release', order=order)
+    order.stock_reserved = False
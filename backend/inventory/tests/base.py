@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from inventory.models import Medicine, Order, OrderItem, Pharmacy, StockMovement
+from inventory.pharmacies import pharmacy_resolver
+from inventory.spatial import pharmacy_index
+
+User = get_user_model()
+
+PHARMACY_COORDINATES = [(-1.95, 30.06), (-1.96, 30.10), (-2.5, 29.7)]
+
+CSV_HEADER = 'name,generic_name,manufacturer,category,dosage,unit_price,stock_quantity,minimum_stock,expiry_date,description'
+
+
+class InventoryTestCase(TestCase):
+    """Three pharmacies, a patient and 30 medicines spread round-robin.
+
+    Medicine ``i`` is "Amoxicillin i" with ``10 + i`` in stock and belongs to
+    ``self.pharmacies[i % 3]``.
+    """
+
+    def setUp(self):
+        pharmacy_index.invalidate()
+        pharmacy_resolver.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.pharmacies = []
+        for i, (lat, lon) in enumerate(PHARMACY_COORDINATES):
+            user = User.objects.create_user(username=f'p{i}', email=f'p{i}@x.com', password='x', user_type='pharmacy')
+            Pharmacy.objects.create(user=user, name=f'P{i}', address='a', phone='1', latitude=lat, longitude=lon)
+            self.pharmacies.append(user)
+        self.patient = User.objects.create_user(username='pat', email='pat@x.com', password='x', user_type='patient')
+        self.expiry = date.today() + timedelta(days=100)
+        for i in range(30):
+            Medicine.objects.create(
+                pharmacy=self.pharmacies[i % 3], name=f'Amoxicillin {i}', generic_name='amox', manufacturer='m',
+                category='antibiotic', dosage='500mg', unit_price='1.50', stock_quantity=10 + i,
+                expiry_date=self.expiry,
+            )
+
+    def medicines(self, pharmacy=0):
+        return list(Medicine.objects.filter(pharmacy=self.pharmacies[pharmacy]).order_by('id'))
+
+    def make_order(self, quantities, pharmacy=0):
+        """A pending order of the pharmacy's medicines, in id order, with ``quantities``."""
+        order = Order.objects.create(pharmacy=self.pharmacies[pharmacy], patient=self.patient, customer_name='c', customer_phone='1')
+        medicines = self.medicines(pharmacy)
+        for medicine, quantity in zip(medicines, quantities):
+            OrderItem.objects.create(order=order, medicine=medicine, quantity=quantity,
+                                     unit_price=medicine.unit_price, subtotal=medicine.unit_price * quantity)
+        return order, medicines
+
+    def stock(self, medicine):
+        return Medicine.objects.values_list('stock_quantity', flat=True).get(pk=medicine.pk)
+
+    def assertLedgerBalanced(self):
+        totals = dict(
+            StockMovement.objects.values('medicine_id').annotate(total=Sum('quantity')).order_by()
+            .values_list('medicine_id', 'total')
+        )
+        for medicine_id, name, stock_quantity in Medicine.objects.values_list('id', 'name', 'stock_quantity'):
+            self.assertEqual(totals.get(medicine_id, 0), stock_quantity, name)
@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+
+from inventory.models import Medicine
+
+from .base import InventoryTestCase
+
+
+class MedicineAvailabilityTests(InventoryTestCase):
+    def test_selling_out_clears_the_flag(self):
+        medicine = Medicine.objects.first()
+        self.assertTrue(medicine.is_available)
+        medicine.reduce_stock(medicine.stock_quantity)
+        medicine.refresh_from_db()
+        self.assertFalse(medicine.is_available)
+        self.assertEqual(Medicine.objects.available_for_patient().count(), 29)
+
+    def test_expired_medicines_are_swept(self):
+        expired = list(Medicine.objects.values_list('id', flat=True)[:5])
+        Medicine.objects.filter(id__in=expired).update(expiry_date=date.today() - timedelta(days=1))
+        self.assertEqual(Medicine.objects.available_for_patient().count(), 25)
+        out = StringIO()
+        call_command('sweep_expired_medicines', chunk_size=2, stdout=out)
+        self.assertIn('Marked 5', out.getvalue())
+        self.assertEqual(Medicine.objects.filter(is_available=True).count(), 25)
+        # swept rows count as changed for ETags and If-Match
+        self.assertEqual(set(Medicine.objects.filter(id__in=expired).values_list('version', flat=True)), {2})
+        self.assertEqual(set(Medicine.objects.exclude(id__in=expired).values_list('version', flat=True)), {1})
+
+    def test_refresh_availability_only_writes_stale_flags(self):
+        sold_out, stale = Medicine.objects.order_by('id').values_list('id', flat=True)[:2]
+        Medicine.objects.filter(id=sold_out).update(stock_quantity=0)
+        Medicine.objects.filter(id=stale).update(is_available=False)
+        self.assertEqual(Medicine.objects.all().refresh_availability(), 2)
+        self.assertEqual(Medicine.objects.filter(is_available=True).count(), 29)
+        self.assertEqual(Medicine.objects.filter(version=2).count(), 2)
+        self.assertEqual(Medicine.objects.all().refresh_availability(), 0)
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+
+from inventory.models import Medicine
+
+from .base import CSV_HEADER, InventoryTestCase
+
+IMPORT_URL = '/api/inventory/medicines/import/'
+EXPORT_URL = '/api/inventory/medicines/export/'
+
+
+class MedicineImportTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def post(self, body, content_type):
+        return self.client.generic('POST', IMPORT_URL, body.encode(), content_type=content_type)
+
+    def test_csv_creates_updates_and_reports_bad_rows(self):
+        exp = self.expiry.isoformat()
+        lines = [CSV_HEADER]
+        lines += [f'Imp{i},g,m,c,10mg,2.50,{i},5,{exp},"multi\nline"' for i in range(1200)]
+        lines.append(f'Bad,g,m,c,10mg,xx,1,5,{exp},d')
+        lines.append(f'Amoxicillin 0,amox,m,antibiotic,500mg,9.99,77,,{exp},')
+        response = self.post('\n'.join(lines), 'text/csv')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['created'], response.data['updated']), (1200, 1))
+        self.assertEqual([error['row'] for error in response.data['errors']], [1201])
+        updated = Medicine.objects.get(pharmacy=self.pharmacies[0], name='Amoxicillin 0')
+        self.assertEqual((updated.stock_quantity, str(updated.unit_price)), (77, '9.99'))
+        self.assertFalse(Medicine.objects.get(name='Imp0').is_available)
+        self.assertEqual(Medicine.objects.get(name='Imp5').description, 'multi\nline')
+
+    def test_ndjson_reports_unparseable_lines(self):
+        row = {'name': 'Amoxicillin 0', 'generic_name': 'amox', 'manufacturer': 'm', 'category': 'antibiotic',
+               'dosage': '500mg', 'unit_price': '1', 'stock_quantity': 3, 'expiry_date': self.expiry.isoformat()}
+        response = self.post('\n'.join([json.dumps(row), 'nope', '[1]', '']), 'application/x-ndjson')
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(self.stock(self.medicines()[0]), 3)
+
+    def test_unsupported_content_type(self):
+        self.assertEqual(self.post('x', 'application/json').status_code, 415)
+
+    def test_patients_cannot_import(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.post(CSV_HEADER, 'text/csv').status_code, 403)
+
+
+class MedicineBatchUniquenessTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+        self.first, self.second = self.medicines()[:2]
+
+    def test_create_duplicate_batch_is_rejected(self):
+        body = {'name': self.first.name, 'manufacturer': 'm', 'category': 'c', 'dosage': '500mg', 'unit_price': '1',
+                'stock_quantity': 3, 'expiry_date': self.expiry.isoformat()}
+        response = self.client.post('/api/inventory/medicines/', body, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_renaming_onto_an_existing_batch_is_a_400(self):
+        url = f'/api/inventory/medicines/{self.second.id}/'
+        response = self.client.patch(url, {'name': self.first.name}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already exists', response.data['error'])
+        response = self.client.patch(url, {'name': 'Fresh'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class MedicineExportTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def export(self, **params):
+        response = self.client.get(EXPORT_URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_round_trips_through_import(self):
+        body = self.export()
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(body)))), 10)
+        response = self.client.generic('POST', IMPORT_URL, body.encode(), content_type='text/csv')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['errors']), (0, 10, []))
+
+    def test_ndjson_and_updated_since(self):
+        lines = self.export(format='ndjson').splitlines()
+        self.assertEqual(len(lines), 10)
+        last = json.loads(lines[-1])
+        self.assertEqual(set(last), {'id', 'name', 'generic_name', 'manufacturer', 'category', 'dosage', 'unit_price',
+                                     'stock_quantity', 'minimum_stock', 'expiry_date', 'description', 'updated_at'})
+        self.assertEqual(len(self.export(format='ndjson', updated_since=last['updated_at']).splitlines()), 1)
+        self.assertEqual(len(self.export(updated_since='2000-01-01').splitlines()), 11)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(EXPORT_URL, {'updated_since': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(EXPORT_URL, {'format': 'xml'}).status_code, 404)
+
+    def test_patients_cannot_export(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(EXPORT_URL).status_code, 403)
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from inventory import cache as catalogue_cache
+from inventory.models import Medicine
+
+from .base import InventoryTestCase
+
+User = get_user_model()
+
+
+class CatalogueCacheTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.patient)
+
+    def test_equivalent_searches_share_an_entry(self):
+        first = self.client.get('/api/inventory/medicines/', {'search': 'amox'})
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/inventory/medicines/', {'search': ' AMOX '})
+        self.assertEqual(first.data, second.data)
+        stats = catalogue_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_stock_change_invalidates(self):
+        self.client.get('/api/inventory/medicines/', {'search': 'amox'})
+        medicine = Medicine.objects.first()
+        medicine.stock_quantity = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            medicine.save()
+        response = self.client.get('/api/inventory/medicines/', {'search': 'amox'})
+        self.assertEqual(len(response.data), 29)
+
+    def test_write_from_another_process_is_not_served_stale(self):
+        first = self.client.get('/api/inventory/medicines/', {'search': 'amox'})
+        medicine = Medicine.objects.first()
+        # a queryset update fires no invalidation here, as a write in another worker would not
+        Medicine.objects.filter(pk=medicine.pk).update(stock_quantity=999, updated_at=timezone.now())
+        second = self.client.get('/api/inventory/medicines/', {'search': 'amox'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        row = next(row for row in second.data if row['id'] == medicine.pk)
+        self.assertEqual(row['stock_quantity'], 999)
+        third = self.client.get('/api/inventory/medicines/', {'search': 'amox'}, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, 304)
+
+    def test_nearby_points_share_a_tile_but_keep_their_own_distances(self):
+        first = self.client.get('/api/inventory/medicines/', {'latitude': -1.95, 'longitude': 30.06, 'radius': 3})
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/inventory/medicines/', {'latitude': -1.9501, 'longitude': 30.0601, 'radius': 3})
+        self.assertEqual(len(first.data), 10)
+        self.assertEqual(len(second.data), 10)
+        self.assertNotEqual(first.data[0]['distance_km'], second.data[0]['distance_km'])
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/inventory/medicines/cache-stats/').status_code, 403)
+        admin = User.objects.create_superuser(username='admin', email='admin@x.com', password='x')
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get('/api/inventory/medicines/cache-stats/').status_code, 200)
@@ -0,0 +1,37 @@
+from inventory.models import Medicine
+
+from .base import InventoryTestCase
+
+
+class ConditionalGetTests(InventoryTestCase):
+    def test_catalogue_not_modified(self):
+        self.client.force_authenticate(self.patient)
+        etag = self.client.get('/api/inventory/medicines/', {'search': 'amox'})['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/inventory/medicines/', {'search': 'amox'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/inventory/medicines/', {'search': 'amo'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_stock_change_changes_the_etag(self):
+        self.client.force_authenticate(self.patient)
+        etag = self.client.get('/api/inventory/medicines/', {'search': 'amox'})['ETag']
+        medicine = Medicine.objects.first()
+        medicine.stock_quantity = 1
+        medicine.save()
+        response = self.client.get('/api/inventory/medicines/', {'search': 'amox'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_patient_orders_not_modified(self):
+        self.client.force_authenticate(self.patient)
+        etag = self.client.get('/api/inventory/orders/my/')['ETag']
+        response = self.client.get('/api/inventory/orders/my/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_pharmacy_endpoints_accept_weak_tags(self):
+        self.client.force_authenticate(self.pharmacies[0])
+        medicine = self.medicines()[0]
+        for url in ['/api/inventory/orders/', '/api/inventory/medicines/low-stock/', f'/api/inventory/medicines/{medicine.id}/']:
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH='W/' + etag)
+            self.assertEqual(response.status_code, 304, url)
@@ -0,0 +1,63 @@
+from io import StringIO
+
+from django.core.management import call_command
+
+from inventory.customers import normalize_email, normalize_phone
+from inventory.models import Customer, Pharmacy, Sale
+from inventory.views import _get_or_create_customer
+
+from .base import InventoryTestCase
+
+
+class CustomerKeyTests(InventoryTestCase):
+    def test_normalization(self):
+        self.assertEqual(normalize_email(' Bob@X.com '), 'bob@x.com')
+        self.assertIsNone(normalize_email('  '))
+        self.assertEqual(normalize_phone('(0788) 123-456'), '0788123456')
+        self.assertIsNone(normalize_phone(None))
+
+    def test_phone_lookup_ignores_formatting(self):
+        customer = _get_or_create_customer('A', None, '0788-123 456')
+        with self.assertNumQueries(1):
+            self.assertEqual(_get_or_create_customer('A2', None, '(0788) 123456').id, customer.id)
+
+    def test_email_lookup_ignores_case_and_wins_over_phone(self):
+        customer = _get_or_create_customer('B', ' Bob@X.com ', None)
+        self.assertEqual(_get_or_create_customer(None, 'bob@x.COM', '1').id, customer.id)
+
+    def test_new_email_with_a_known_phone_fills_in_the_email(self):
+        known = Customer.objects.create(name='Old', phone='0788 123')
+        self.assertEqual(_get_or_create_customer('N', 'new@x.com', '0788123').id, known.id)
+        known.refresh_from_db()
+        self.assertEqual(known.email, 'new@x.com')
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_new_email_with_a_phone_owned_by_another_email(self):
+        known = Customer.objects.create(name='Old', email='old@x.com', phone='0788 123')
+        self.assertEqual(_get_or_create_customer('N', 'new@x.com', '0788123').id, known.id)
+        known.refresh_from_db()
+        self.assertEqual(known.email, 'old@x.com')
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class DedupeCustomersTests(InventoryTestCase):
+    def test_duplicates_are_merged_and_their_sales_moved(self):
+        by_phone = _get_or_create_customer('A', None, '0788-123 456')
+        _get_or_create_customer('B', 'bob@x.com', None)
+        # rows written without save() keep empty keys, as legacy rows did
+        Customer.objects.bulk_create([
+            Customer(name='', email='BOB@x.com'),
+            Customer(name='Z', phone='0788123456'),
+            Customer(name='Q', phone='9'),
+        ])
+        duplicate = Customer.objects.get(name='Z')
+        medicine = self.medicines()[0]
+        pharmacy = Pharmacy.objects.get(user=self.pharmacies[0])
+        Sale.objects.create(pharmacy=pharmacy, medicine=medicine, quantity=1, total_price=1, customer=duplicate)
+
+        out = StringIO()
+        call_command('dedupe_customers', '--chunk-size', '2', stdout=out)
+        self.assertIn('merged 2 duplicates', out.getvalue())
+        self.assertEqual(Sale.objects.get().customer_id, by_phone.id)
+        self.assertEqual(Customer.objects.count(), 3)
+        self.assertEqual(Customer.objects.get(name='Q').phone_digits, '9')
@@ -0,0 +1,112 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from inventory.models import IdempotencyKey, Order, Sale
+
+from .base import InventoryTestCase
+
+SELL_URL = '/api/inventory/sell/'
+
+
+class IdempotencyKeyTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+        self.medicine = self.medicines()[0]
+        self.body = {'medicine_id': self.medicine.id, 'quantity': 2}
+
+    def sell(self, body, key='k1'):
+        extra = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(SELL_URL, body, format='json', **extra)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.sell(self.body)
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):
+            second = self.sell(self.body)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.stock(self.medicine), self.medicine.stock_quantity - 2)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_same_key_with_another_body_is_a_422(self):
+        self.sell(self.body)
+        self.assertEqual(self.sell({'medicine_id': self.medicine.id, 'quantity': 3}).status_code, 422)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.sell(self.body)
+        self.sell(self.body, key=None)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_client_errors_are_replayed_too(self):
+        body = {'medicine_id': self.medicine.id, 'quantity': 9999}
+        self.assertEqual(self.sell(body, key='k2').status_code, 400)
+        response = self.sell(body, key='k2')
+        self.assertEqual((response.status_code, response['Idempotent-Replayed']), (400, 'true'))
+
+    def test_in_flight_key_is_a_409_until_its_lease_runs_out(self):
+        self.sell(self.body)
+        # as if the first worker died between claiming the key and storing the response
+        IdempotencyKey.objects.update(response_status=None, response_body=None)
+        self.assertEqual(self.sell(self.body).status_code, 409)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        response = self.sell(self.body)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(self.sell(self.body)['Idempotent-Replayed'], 'true')
+
+    def test_place_order_is_idempotent(self):
+        self.client.force_authenticate(self.patient)
+        body = {'pharmacy_id': self.pharmacies[0].id, 'items': [{'medicine_id': self.medicine.id, 'quantity': 1}], 'customer_phone': '1'}
+        first = self.client.post('/api/inventory/orders/place/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        second = self.client.post('/api/inventory/orders/place/', body, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_keys_are_purged(self):
+        self.sell(self.body)
+        self.sell(self.body, key='k2')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', '--chunk-size', '1', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_response_is_stored_with_the_views_writes(self):
+        real_update = QuerySet.update
+
+        def failing_update(queryset, **kwargs):
+            if queryset.model is IdempotencyKey and 'response_status' in kwargs:
+                raise DatabaseError('worker died')
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', failing_update), self.assertRaises(DatabaseError):
+            self.sell(self.body)
+        # the sale went away with the missing response, and the key is free for the retry
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(self.stock(self.medicine), self.medicine.stock_quantity)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.sell(self.body).status_code, 201)
+        self.assertEqual(Sale.objects.count(), 1)
+
+    def test_superseded_claim_rolls_its_writes_back(self):
+        real_update = QuerySet.update
+
+        def taken_over(queryset, **kwargs):
+            if queryset.model is IdempotencyKey and 'response_status' in kwargs:
+                # another retry took the claim over while this request was running
+                real_update(IdempotencyKey.objects.all(), created_at=timezone.now() + timedelta(seconds=1))
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', taken_over):
+            response = self.sell(self.body)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Sale.objects.exists())
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
@@ -0,0 +1,78 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+
+from inventory import stock
+from inventory.models import Medicine, StockMovement
+
+from .base import CSV_HEADER, InventoryTestCase
+
+
+class StockLedgerTests(InventoryTestCase):
+    """Every stock write leaves ledger rows that sum to stock_quantity."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def test_initial_stock_is_recorded(self):
+        self.assertLedgerBalanced()
+
+    def test_reservation_and_release(self):
+        order, _ = self.make_order([2, 3])
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/approve/').status_code, 200)
+        self.assertLedgerBalanced()
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/reject/').status_code, 200)
+        self.assertLedgerBalanced()
+
+    def test_batch_reservation_and_release(self):
+        order, _ = self.make_order([1, 1, 1])
+        url = '/api/inventory/orders/batch-transition/'
+        self.assertEqual(self.client.post(url, {'action': 'approve', 'order_ids': [order.id]}, format='json').status_code, 200)
+        self.assertLedgerBalanced()
+        self.assertEqual(self.client.post(url, {'action': 'reject', 'order_ids': [order.id]}, format='json').status_code, 200)
+        self.assertLedgerBalanced()
+
+    def test_refused_sale_writes_nothing(self):
+        medicine = self.medicines()[0]
+        self.assertEqual(self.client.post('/api/inventory/sell/', {'medicine_id': medicine.id, 'quantity': 4}, format='json').status_code, 201)
+        self.assertEqual(self.client.post('/api/inventory/sell/', {'medicine_id': medicine.id, 'quantity': 400}, format='json').status_code, 400)
+        self.assertEqual(StockMovement.objects.filter(kind='sale').count(), 1)
+        self.assertLedgerBalanced()
+
+    def test_direct_edits_and_imports(self):
+        medicine = self.medicines()[1]
+        medicine.stock_quantity = 99
+        medicine.save()
+        medicine.save()
+        exp = self.expiry.isoformat()
+        body = f'{CSV_HEADER}\nAmoxicillin 0,amox,m,antibiotic,500mg,9.99,77,,{exp},\nNew,g,m,c,1mg,1,5,,{exp},\n'
+        response = self.client.generic('POST', '/api/inventory/medicines/import/', body.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertLedgerBalanced()
+
+    def test_check_and_fix_drift(self):
+        Medicine.objects.filter(id=self.medicines()[2].id).update(stock_quantity=1)
+        out = StringIO()
+        call_command('check_stock_ledger', stdout=out)
+        self.assertIn('1 out of line', out.getvalue())
+        call_command('check_stock_ledger', '--fix', '--chunk-size', '7', stdout=StringIO())
+        self.assertLedgerBalanced()
+
+    def test_fix_keeps_a_sale_made_after_the_check(self):
+        drifted, sold = self.medicines()[2:4]
+        Medicine.objects.filter(id=drifted.id).update(stock_quantity=1)
+        real_lock = stock.lock
+        pending_sale = [{drifted.id: -1, sold.id: -1}]
+
+        def sale_then_lock(ids, **filters):
+            if pending_sale:
+                # a sale commits between the unlocked check and the fix
+                stock.apply(deltas=pending_sale.pop(), kind='sale')
+            return real_lock(ids, **filters)
+
+        with mock.patch.object(stock, 'lock', side_effect=sale_then_lock):
+            call_command('check_stock_ledger', '--fix', stdout=StringIO())
+        self.assertLedgerBalanced()
+        self.assertEqual(self.stock(drifted), drifted.stock_quantity - 1)
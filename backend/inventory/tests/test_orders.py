@@ -0,0 +1,132 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
+
+from inventory.models import Medicine, Order, Sale
+
+from .base import InventoryTestCase
+
+
+class OrderReservationTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def stocks(self, medicines):
+        return dict(Medicine.objects.filter(id__in=[m.id for m in medicines]).values_list('id', 'stock_quantity'))
+
+    def test_approve_reserves_and_reject_releases(self):
+        order, meds = self.make_order([5, 10, 3, 1, 1, 1, 1, 1])
+        response = self.client.post(f'/api/inventory/orders/{order.id}/approve/')
+        self.assertEqual(response.status_code, 200, response.data)
+        stocks = self.stocks(meds)
+        self.assertEqual(stocks[meds[0].id], meds[0].stock_quantity - 5)
+        self.assertEqual(stocks[meds[1].id], meds[1].stock_quantity - 10)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.stock_reserved), ('approved', True))
+
+        response = self.client.post(f'/api/inventory/orders/{order.id}/reject/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stocks(meds), {m.id: m.stock_quantity for m in meds})
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.stock_reserved), ('rejected', False))
+
+    def test_shortfall_reserves_nothing(self):
+        order, meds = self.make_order([1, 1000])
+        response = self.client.post(f'/api/inventory/orders/{order.id}/approve/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(meds[1].name, response.data['error'])
+        self.assertEqual(self.stock(meds[0]), meds[0].stock_quantity)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.stock_reserved), ('pending', False))
+
+    def test_put_and_direct_save_reserve_once(self):
+        order, meds = self.make_order([2])
+        response = self.client.put(f'/api/inventory/orders/{order.id}/', {'status': 'approved'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(meds[0]), 8)
+
+        other, _ = self.make_order([3])
+        other.status = 'approved'
+        other.save()
+        other.save()
+        self.assertEqual(self.stock(meds[0]), 5)
+        other.refresh_from_db()
+        self.assertTrue(other.stock_reserved)
+
+    def test_confirming_an_unreserved_order_takes_stock_then(self):
+        order, meds = self.make_order([2, 2])
+        Order.objects.filter(pk=order.pk).update(status='shipped')
+        self.client.force_authenticate(self.patient)
+        response = self.client.post(f'/api/inventory/orders/{order.id}/confirm/', {}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.stock(meds[0]), 8)
+        self.assertEqual(Sale.objects.filter(medicine__in=meds[:2]).count(), 2)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'completed')
+
+
+class PlaceOrderTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.patient)
+        self.meds = self.medicines()
+
+    def place(self, items):
+        body = {'pharmacy_id': self.pharmacies[0].id, 'items': items, 'customer_phone': '1'}
+        return self.client.post('/api/inventory/orders/place/', body, format='json')
+
+    def test_items_are_written_in_bulk(self):
+        items = [{'medicine_id': m.id, 'quantity': 2} for m in self.meds] * 3
+        items += [{'medicine_id': str(self.meds[0].id), 'quantity': 1}, {'medicine_id': self.meds[1].id, 'quantity': 0}]
+        with self.assertNumQueries(7):
+            response = self.place(items)
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get(pk=response.data['order_id'])
+        self.assertEqual(order.items.count(), 31)
+        self.assertEqual(order.total_amount, sum(item.subtotal for item in order.items.all()))
+        self.assertEqual(response.data['total'], float(order.total_amount))
+
+    def test_unknown_medicine_creates_nothing(self):
+        response = self.place([{'medicine_id': self.meds[0].id, 'quantity': 1}, {'medicine_id': 99999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderListTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(60):
+            self.make_order([1, 2, 3])
+        self.old = list(Order.objects.order_by('id').values_list('id', flat=True)[:10])
+        Order.objects.filter(id__in=self.old).update(status='approved', created_at=timezone.now() - timedelta(days=5))
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def test_plain_list_omits_items(self):
+        response = self.client.get('/api/inventory/orders/')
+        self.assertEqual(len(response.data), 60)
+        self.assertNotIn('items', response.data[0])
+
+    def test_expanded_pages(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/inventory/orders/', {'expand': 'items', 'limit': 50})
+        first = response.data['results']
+        self.assertEqual(len(first), 50)
+        self.assertEqual(len(first[0]['items']), 3)
+        self.assertEqual(first[0]['items'][0]['medicine']['pharmacy_name'], 'p0')
+        response = self.client.get('/api/inventory/orders/', {'expand': 'items', 'limit': 50, 'cursor': response.data['next']})
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len({order['id'] for order in first + response.data['results']}), 60)
+
+    def test_filters(self):
+        self.assertEqual(len(self.client.get('/api/inventory/orders/', {'status': 'approved,shipped'}).data), 10)
+        self.assertEqual(len(self.client.get('/api/inventory/orders/', {'to': (date.today() - timedelta(days=2)).isoformat()}).data), 10)
+        self.assertEqual(len(self.client.get('/api/inventory/orders/', {'from': date.today().isoformat()}).data), 50)
+        self.assertEqual(self.client.get('/api/inventory/orders/', {'from': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/inventory/orders/', {'cursor': 'x'}).status_code, 400)
+
+    def test_patient_orders_page(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get('/api/inventory/orders/my/', {'expand': 'items', 'limit': 5})
+        self.assertEqual(len(response.data['results']), 5)
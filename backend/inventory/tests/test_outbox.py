@@ -0,0 +1,82 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+
+from inventory import outbox
+from inventory.models import OutboxEmail
+
+from .base import InventoryTestCase
+
+
+class FlakyBackend(EmailBackend):
+    """Fails for bad@x.com and counts how often it was opened."""
+
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+
+    def send_messages(self, messages):
+        if 'bad@x.com' in messages[0].to:
+            raise OSError('boom')
+        return super().send_messages(messages)
+
+
+class OutboxTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        FlakyBackend.opened = 0
+
+    def test_order_mail_is_queued_not_sent(self):
+        self.client.force_authenticate(self.patient)
+        medicine = self.medicines()[0]
+        body = {'pharmacy_id': self.pharmacies[0].id, 'items': [{'medicine_id': medicine.id, 'quantity': 1}], 'customer_phone': '1'}
+        self.client.post('/api/inventory/orders/place/', body, format='json')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(status='pending').count(), 1)
+
+    def test_dispatch_sends_over_one_connection_and_backs_off_failures(self):
+        outbox.enqueue('s', 'b', ['a@x.com'])
+        outbox.enqueue('s', 'b', ['b@x.com'])
+        bad = outbox.enqueue('s', 'b', ['bad@x.com'])
+        self.assertEqual(outbox.dispatch(connection=FlakyBackend()), (2, 1))
+        self.assertEqual(FlakyBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 2)
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts, bad.last_error), ('pending', 1, 'boom'))
+        self.assertGreater(bad.next_attempt_at, bad.created_at)
+        self.assertEqual(outbox.dispatch(connection=FlakyBackend()), (0, 0))
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            OutboxEmail.objects.filter(pk=bad.pk).update(next_attempt_at=bad.created_at)
+            outbox.dispatch(connection=FlakyBackend())
+        bad.refresh_from_db()
+        self.assertEqual(bad.status, 'failed')
+
+    def test_no_transaction_is_open_while_sending(self):
+        depth = len(connection.savepoint_ids)
+        seen = []
+
+        class Probe(EmailBackend):
+            def send_messages(self, messages):
+                seen.append(len(connection.savepoint_ids))
+                return super().send_messages(messages)
+
+        outbox.enqueue('s', 'b', ['a@x.com'])
+        self.assertEqual(outbox.dispatch(connection=Probe()), (1, 0))
+        self.assertEqual(seen, [depth])
+
+    def test_leased_rows_are_skipped(self):
+        email = outbox.enqueue('s', 'b', ['a@x.com'])
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now() + timedelta(seconds=300))
+        self.assertEqual(outbox.dispatch(connection=FlakyBackend()), (0, 0))
+
+    def test_run_outbox_once(self):
+        outbox.enqueue('s', 'b', ['ok@x.com'])
+        call_command('run_outbox', '--once', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,78 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from inventory.pagination import encode_cursor
+
+from .base import InventoryTestCase
+
+KIGALI = {'latitude': -1.95, 'longitude': 30.06}
+
+
+class MedicineCursorPaginationTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.patient)
+
+    def walk(self, params):
+        rows, cursor = [], None
+        while True:
+            page = dict(params, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get('/api/inventory/medicines/', page)
+            self.assertEqual(response.status_code, 200)
+            rows += response.data['results']
+            cursor = response.data['next']
+            if not cursor:
+                return rows
+
+    def test_pages_cover_every_medicine_newest_first(self):
+        ids = [row['id'] for row in self.walk({'limit': 7})]
+        self.assertEqual(len(ids), 30)
+        self.assertEqual(ids, sorted(ids, reverse=True))
+
+    def test_distance_pages_are_ordered_by_distance(self):
+        rows = self.walk({'limit': 4, **KIGALI})
+        self.assertEqual(len({row['id'] for row in rows}), 30)
+        distances = [row['distance_km'] for row in rows]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_distance_pages_load_one_page_of_medicines(self):
+        response = self.client.get('/api/inventory/medicines/', {'limit': 4, **KIGALI})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/inventory/medicines/', {'limit': 4, 'cursor': response.data['next'], **KIGALI})
+        ranked = [query['sql'] for query in ctx.captured_queries if 'group_rank' in query['sql']]
+        self.assertEqual(len(ranked), 1)
+        self.assertIn('LIMIT 5', ranked[0])
+
+    def test_without_limit_the_plain_list_is_returned(self):
+        response = self.client.get('/api/inventory/medicines/')
+        self.assertIsInstance(response.data, list)
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get('/api/inventory/medicines/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BadCursorTests(InventoryTestCase):
+    """Malformed cursors are a 400 on every keyset-paginated endpoint."""
+
+    cursors = [['abc', 1], [{'a': 1}, 2], [None, 1], [1], 'abc']
+
+    def get(self, url, values, **params):
+        return self.client.get(url, {'cursor': encode_cursor(values) if isinstance(values, list) else values, **params})
+
+    def test_medicine_list(self):
+        self.client.force_authenticate(self.patient)
+        for values in self.cursors:
+            self.assertEqual(self.get('/api/inventory/medicines/', values).status_code, 400, values)
+            self.assertEqual(self.get('/api/inventory/medicines/', values, search='amox').status_code, 400, values)
+
+    def test_distance_cursor(self):
+        self.client.force_authenticate(self.patient)
+        for values in (['far', 1, 1], [1.0, 'x', 1], [True, 1, 1], [1.0, 1, None], [{'a': 1}, 2, 3], [1, 1], 'abc'):
+            self.assertEqual(self.get('/api/inventory/medicines/', values, **KIGALI).status_code, 400, values)
+
+    def test_orders_and_sales(self):
+        self.client.force_authenticate(self.pharmacies[0])
+        for url in ('/api/inventory/orders/', '/api/inventory/sales/'):
+            for values in self.cursors:
+                self.assertEqual(self.get(url, values).status_code, 400, (url, values))
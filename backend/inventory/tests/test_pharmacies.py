@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+
+from inventory.models import Medicine, Pharmacy
+from inventory.pharmacies import PharmacyResolver, pharmacy_resolver, resolve
+
+from .base import InventoryTestCase
+
+User = get_user_model()
+
+
+class PharmacyResolverTests(InventoryTestCase):
+    def test_lru_evicts_the_oldest_entry(self):
+        resolver = PharmacyResolver(maxsize=2)
+        resolver.put(1, 'a')
+        resolver.put(2, 'b')
+        resolver.get(1)
+        resolver.put(3, 'c')
+        self.assertIsNone(resolver.get(2))
+        self.assertEqual((resolver.get(1), resolver.get(3)), ('a', 'c'))
+
+    def test_entries_expire(self):
+        resolver = PharmacyResolver()
+        resolver.put(1, 'a')
+        with self.settings(PHARMACY_INDEX_TTL=-1):
+            self.assertIsNone(resolver.get(1))
+
+    def test_cached_lookup_skips_the_query(self):
+        self.client.force_authenticate(self.pharmacies[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/api/inventory/sales/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/inventory/sales/')
+
+    def test_missing_row_is_created_and_dropped_on_change(self):
+        user = User.objects.create_user(username='p9', email='p9@x.com', password='x', user_type='pharmacy')
+        medicine = Medicine.objects.create(pharmacy=user, name='X', manufacturer='m', category='c', dosage='1',
+                                           unit_price='2.00', stock_quantity=5, expiry_date=self.expiry)
+        self.client.force_authenticate(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/inventory/sell/', {'medicine_id': medicine.id, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        pharmacy = Pharmacy.objects.get(user=user)
+        self.assertEqual(pharmacy.name, 'p9 Pharmacy')
+        self.assertEqual(pharmacy_resolver.get(user.pk).pk, pharmacy.pk)
+        pharmacy.name = 'New'
+        with self.captureOnCommitCallbacks(execute=True):
+            pharmacy.save()
+        self.assertIsNone(pharmacy_resolver.get(user.pk))
+
+    def test_create_false_returns_none(self):
+        user = User.objects.create_user(username='p9', email='p9@x.com', password='x', user_type='pharmacy')
+        self.assertIsNone(resolve(user, create=False))
+        self.assertFalse(Pharmacy.objects.filter(user=user).exists())
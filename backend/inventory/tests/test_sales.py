@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from inventory.models import Customer, Pharmacy, Sale
+
+from .base import InventoryTestCase
+
+BASKET_URL = '/api/inventory/sell/basket/'
+
+
+class BasketSaleTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+        self.meds = self.medicines()
+
+    def sell(self, items, **customer):
+        return self.client.post(BASKET_URL, {'items': items, **customer}, format='json')
+
+    def test_basket_is_sold_in_one_go(self):
+        items = [{'medicine_id': m.id, 'quantity': 2} for m in self.meds] + [{'medicine_id': self.meds[0].id, 'quantity': 1}]
+        response = self.sell(items, customer_name='Bob', customer_phone='0788 123')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['items']), 11)
+        # repeated lines report the stock left after the whole basket
+        self.assertEqual(response.data['items'][0]['remaining_stock'], self.meds[0].stock_quantity - 3)
+        self.assertEqual(response.data['items'][-1]['remaining_stock'], self.meds[0].stock_quantity - 3)
+        self.assertEqual(Sale.objects.count(), 11)
+        self.assertEqual(set(Sale.objects.values_list('customer_id', flat=True)), {response.data['customer_id']})
+        self.assertLedgerBalanced()
+
+    def test_other_pharmacies_medicines_are_not_found(self):
+        other = self.medicines(1)[0]
+        response = self.sell([{'medicine_id': self.meds[1].id, 'quantity': 1}, {'medicine_id': other.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_shortfall_sells_nothing(self):
+        response = self.sell([{'medicine_id': self.meds[1].id, 'quantity': 1}, {'medicine_id': self.meds[2].id, 'quantity': 999}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['medicine_ids'], [self.meds[2].id])
+        self.assertEqual(self.stock(self.meds[1]), self.meds[1].stock_quantity)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_empty_basket(self):
+        self.assertEqual(self.sell([]).status_code, 400)
+
+    def test_new_email_with_a_known_phone_reuses_the_customer(self):
+        known = Customer.objects.create(name='P', phone='0799 1')
+        response = self.sell([{'medicine_id': self.meds[0].id, 'quantity': 1}], customer_email='z@x.com', customer_phone='07991')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['customer_id'], known.id)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_new_email_with_a_phone_owned_by_another_email(self):
+        known = Customer.objects.create(name='P', email='p@x.com', phone='0799 1')
+        response = self.sell([{'medicine_id': self.meds[0].id, 'quantity': 1}], customer_email='z@x.com', customer_phone='07991')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['customer_id'], known.id)
+        self.assertEqual(Customer.objects.count(), 1)
+
+
+class OfflineSyncTests(InventoryTestCase):
+    url = '/api/inventory/sell/sync/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+        self.meds = self.medicines()
+
+    def test_replay_reports_accepted_duplicates_and_conflicts(self):
+        first = self.meds[0]  # 10 in stock: three sales of 3 fit, the fourth and fifth do not
+        sales = [{'client_id': f'c{i}', 'medicine_id': first.id, 'quantity': 3, 'sold_at': f'2026-05-01T10:{i:02d}:00Z',
+                  'customer_name': 'A', 'customer_phone': '1'} for i in range(5)]
+        sales.append(dict(sales[0]))
+        sales += [{'client_id': f'd{i}', 'medicine_id': self.meds[1 + i % 9].id, 'quantity': 1,
+                   'sold_at': '2026-05-01T09:00:00Z'} for i in range(100)]
+        sales.append({'client_id': 'x', 'medicine_id': self.medicines(1)[0].id, 'quantity': 1, 'sold_at': '2026-05-01T09:00:00Z'})
+
+        response = self.client.post(self.url, {'sales': sales}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(response.data['accepted']), 103)
+        self.assertEqual(response.data['duplicates'], ['c0'])
+        self.assertEqual([c['client_id'] for c in response.data['conflicts']], ['x', 'c3', 'c4'])
+        self.assertEqual(self.stock(first), 1)
+        self.assertEqual(Sale.objects.get(client_id='c1').sale_date.minute, 1)
+        self.assertLedgerBalanced()
+
+    def test_resync_is_a_no_op(self):
+        sales = [{'client_id': f'c{i}', 'medicine_id': self.meds[0].id, 'quantity': 1, 'sold_at': '2026-05-01T10:00:00Z'} for i in range(3)]
+        self.client.post(self.url, {'sales': sales}, format='json')
+        response = self.client.post(self.url, {'sales': sales}, format='json')
+        self.assertEqual(response.data['accepted'], [])
+        self.assertEqual(response.data['duplicates'], ['c0', 'c1', 'c2'])
+        self.assertEqual(self.stock(self.meds[0]), self.meds[0].stock_quantity - 3)
+
+
+class PharmacySalesListTests(InventoryTestCase):
+    url = '/api/inventory/sales/'
+
+    def setUp(self):
+        super().setUp()
+        pharmacy = Pharmacy.objects.get(user=self.pharmacies[0])
+        self.meds = self.medicines()
+        self.customer = Customer.objects.create(name='C', phone='123')
+        self.now = timezone.now()
+        Sale.objects.bulk_create([
+            Sale(pharmacy=pharmacy, medicine=self.meds[i % 3], quantity=1, total_price=1,
+                 customer=self.customer if i % 2 else None, sale_date=self.now - timedelta(days=i // 2))
+            for i in range(120)
+        ])
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def test_plain_list_is_capped(self):
+        self.assertEqual(len(self.client.get(self.url).data), 50)
+
+    def test_pages_cover_every_sale(self):
+        ids, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, {'limit': 25, **({'cursor': cursor} if cursor else {})})
+            ids += [row['id'] for row in response.data['results']]
+            cursor = response.data['next']
+            if not cursor:
+                break
+        self.assertEqual(len(set(ids)), 120)
+
+    def test_filters(self):
+        response = self.client.get(self.url, {'medicine_id': self.meds[0].id, 'customer_id': self.customer.id, 'limit': 200})
+        self.assertEqual(len(response.data['results']), 20)
+        response = self.client.get(self.url, {'from': (self.now - timedelta(days=2)).date().isoformat()})
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(self.client.get(self.url, {'medicine_id': 'x'}).status_code, 400)
@@ -0,0 +1,64 @@
+from unittest import mock, skipIf
+
+from django.db import connection
+
+from inventory import search
+from inventory.models import Medicine
+
+from .base import InventoryTestCase
+
+
+class MedicineSearchTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.paracetamol = Medicine.objects.create(
+            pharmacy=self.pharmacies[0], name='Paracetamol', generic_name='acetaminophen', manufacturer='m',
+            category='analgesic', dosage='500mg', unit_price='1.00', stock_quantity=5, expiry_date=self.expiry,
+        )
+        self.client.force_authenticate(self.patient)
+
+    def search(self, term, **params):
+        return self.client.get('/api/inventory/medicines/', {'search': term, **params})
+
+    def test_matches_name_generic_name_and_category_case_insensitively(self):
+        self.assertEqual([row['name'] for row in self.search('ceTAm').data], ['Paracetamol'])
+        self.assertEqual(len(self.search('amox').data), 30)
+        self.assertEqual(len(self.search('Am').data), 31)
+        self.assertEqual(len(self.search('analg').data), 1)
+
+    def test_search_pages(self):
+        ids, cursor = [], None
+        while True:
+            response = self.search('cillin', limit=7, **({'cursor': cursor} if cursor else {}))
+            ids += [row['id'] for row in response.data['results']]
+            cursor = response.data['next']
+            if not cursor:
+                break
+        self.assertEqual(len(set(ids)), 30)
+
+    def test_index_follows_renames_and_deletes(self):
+        self.paracetamol.name = 'Ibuprofen'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paracetamol.save()
+        self.assertEqual(len(self.search('ibupro').data), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.paracetamol.delete()
+        self.assertEqual(len(self.search('ibupro').data), 0)
+
+    def test_pharmacy_search_ignores_category(self):
+        self.client.force_authenticate(self.pharmacies[0])
+        self.assertEqual(len(self.search('antibio').data), 0)
+        self.assertEqual(len(self.search('amox').data), 10)
+
+
+class SearchBackendTests(InventoryTestCase):
+    @skipIf(connection.vendor == 'postgresql', 'checks the non-PostgreSQL path')
+    def test_no_trigram_ranking_off_postgresql(self):
+        self.assertFalse(search.trigram_available())
+
+    def test_plain_rank_without_an_index(self):
+        with mock.patch.object(search, 'fts_available', return_value=False), \
+                mock.patch.object(search, 'trigram_available', return_value=False):
+            results = search.search(Medicine.objects.all(), 'cillin')
+            self.assertEqual(results.count(), 30)
+            self.assertEqual({m.search_rank for m in results}, {0.0})
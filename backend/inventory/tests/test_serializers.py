@@ -0,0 +1,32 @@
+from rest_framework.renderers import JSONRenderer
+
+from inventory.models import Medicine
+from inventory.serializers import MedicineSerializer, medicine_rows
+from inventory.spatial import pharmacy_index
+
+from .base import InventoryTestCase
+
+
+class MedicineRowsTests(InventoryTestCase):
+    def test_rows_render_like_the_serializer_in_one_query(self):
+        Medicine.objects.filter(id=Medicine.objects.first().id).update(unit_price='3.1')
+        medicines = Medicine.objects.all()
+        expected = JSONRenderer().render(MedicineSerializer(medicines, many=True).data)
+        with self.assertNumQueries(1):
+            rendered = JSONRenderer().render(medicine_rows(medicines))
+        self.assertEqual(rendered, expected)
+
+    def test_low_stock_list_query_count(self):
+        Medicine.objects.update(minimum_stock=100)
+        self.client.force_authenticate(self.pharmacies[0])
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/inventory/medicines/low-stock/')
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(self.client.get('/api/inventory/medicines/expiring-soon/').status_code, 200)
+
+    def test_catalogue_page_query_count(self):
+        pharmacy_index.rebuild()
+        self.client.force_authenticate(self.patient)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/inventory/medicines/', {'limit': 5, 'search': 'amox'})
+        self.assertEqual(len(response.data['results']), 5)
@@ -0,0 +1,32 @@
+from inventory.models import Pharmacy
+
+from .base import InventoryTestCase
+
+KIGALI = {'latitude': -1.95, 'longitude': 30.06}
+
+
+class MedicineListDistanceTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.patient)
+
+    def test_rows_carry_pharmacy_coordinates_and_distance(self):
+        response = self.client.get('/api/inventory/medicines/', KIGALI)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(response.data[0]['distance_km'], 0.0)
+        self.assertIn('pharmacy_latitude', response.data[0])
+
+    def test_radius_filters_by_distance(self):
+        response = self.client.get('/api/inventory/medicines/', {**KIGALI, 'radius': 10})
+        self.assertEqual(len(response.data), 20)
+        self.assertTrue(all(row['distance_km'] <= 10 for row in response.data))
+
+    def test_moving_a_pharmacy_refreshes_the_index(self):
+        self.client.get('/api/inventory/medicines/', {**KIGALI, 'radius': 10})
+        pharmacy = Pharmacy.objects.get(user=self.pharmacies[2])
+        pharmacy.latitude, pharmacy.longitude = -1.951, 30.061
+        with self.captureOnCommitCallbacks(execute=True):
+            pharmacy.save()
+        response = self.client.get('/api/inventory/medicines/', {**KIGALI, 'radius': 10})
+        self.assertEqual(len(response.data), 30)
@@ -0,0 +1,51 @@
+from .base import InventoryTestCase
+
+ADJUST_URL = '/api/inventory/medicines/adjust-stock/'
+
+
+class AdjustStockTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+        self.meds = self.medicines()
+
+    def test_deltas_and_absolutes_in_one_statement(self):
+        a, b, c = self.meds[:3]
+        body = [{'id': a.id, 'delta': -a.stock_quantity}, {'id': b.id, 'absolute': 5}, {'id': c.id, 'delta': 7}]
+        with self.assertNumQueries(5):
+            response = self.client.post(ADJUST_URL, body, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, [
+            {'id': a.id, 'stock_quantity': 0},
+            {'id': b.id, 'stock_quantity': 5},
+            {'id': c.id, 'stock_quantity': c.stock_quantity + 7},
+        ])
+        a.refresh_from_db()
+        c.refresh_from_db()
+        self.assertFalse(a.is_available)
+        self.assertTrue(c.is_available)
+
+    def test_shortfall_rolls_back_the_whole_batch(self):
+        a, b = self.meds[:2]
+        response = self.client.post(ADJUST_URL, [{'id': a.id, 'delta': -a.stock_quantity - 1}, {'id': b.id, 'delta': 1}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['medicine_ids'], [a.id])
+        self.assertEqual(self.stock(b), b.stock_quantity)
+
+    def test_other_pharmacies_medicines_are_not_found(self):
+        other = self.medicines(1)[0]
+        response = self.client.post(ADJUST_URL, [{'id': other.id, 'delta': 1}], format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_lines(self):
+        medicine = self.meds[0]
+        for body in (
+            [{'id': medicine.id, 'delta': 1, 'absolute': 2}],
+            [{'id': medicine.id, 'absolute': -2}],
+            [{'id': medicine.id, 'delta': 1}, {'id': medicine.id, 'delta': 1}],
+        ):
+            self.assertEqual(self.client.post(ADJUST_URL, body, format='json').status_code, 400, body)
+
+    def test_patients_cannot_adjust(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.post(ADJUST_URL, [], format='json').status_code, 403)
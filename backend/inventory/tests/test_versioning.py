@@ -0,0 +1,53 @@
+from django.db import transaction
+
+from inventory.models import Medicine, StaleMedicineError
+
+from .base import InventoryTestCase
+
+
+class MedicineVersionTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.medicine = self.medicines()[0]
+        self.url = f'/api/inventory/medicines/{self.medicine.id}/'
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def test_if_match_with_a_stale_etag_is_a_409(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(response.data['version'], 1)
+        response = self.client.patch(self.url, {'stock_quantity': 50}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['version'], 2)
+        response = self.client.patch(self.url, {'stock_quantity': 60}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['current']['stock_quantity'], 50)
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"nope"').status_code, 409)
+
+    def test_stale_version_in_the_body_is_a_409(self):
+        self.client.patch(self.url, {'stock_quantity': 50}, format='json')
+        response = self.client.patch(self.url, {'stock_quantity': 60, 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch(self.url, {'stock_quantity': 60}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_object_body_is_a_400(self):
+        response = self.client.patch(self.url, [1, 2], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_save_of_a_stale_instance_raises(self):
+        first = Medicine.objects.get(id=self.medicine.id)
+        second = Medicine.objects.get(id=self.medicine.id)
+        first.stock_quantity = 1
+        first.save()
+        second.stock_quantity = 2
+        with self.assertRaises(StaleMedicineError), transaction.atomic():
+            second.save()
+        self.assertEqual(self.stock(self.medicine), 1)
+
+    def test_sales_bump_the_version(self):
+        loaded = Medicine.objects.get(id=self.medicine.id)
+        self.client.post('/api/inventory/sell/', {'medicine_id': self.medicine.id, 'quantity': 1}, format='json')
+        with self.assertRaises(StaleMedicineError), transaction.atomic():
+            loaded.reduce_stock(1)
+        self.assertEqual(self.stock(self.medicine), self.medicine.stock_quantity - 1)
@@ -0,0 +1,129 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from inventory import workflow
+from inventory.models import Notification, Order, Sale
+
+from .base import InventoryTestCase
+
+
+class OrderWorkflowTests(InventoryTestCase):
+    def test_full_flow(self):
+        order, meds = self.make_order([1, 2, 3])
+        self.client.force_authenticate(self.pharmacies[0])
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/approve/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/approve/').status_code, 400)
+
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/approve/').status_code, 403)
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/accept/').status_code, 200)
+
+        self.client.force_authenticate(self.pharmacies[0])
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/ship/').status_code, 200)
+
+        self.client.force_authenticate(self.patient)
+        response = self.client.post(f'/api/inventory/orders/{order.id}/confirm/', {'customer_name': 'Zed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.customer_name), ('completed', 'Zed'))
+        # reserved at approval, not taken a second time on completion
+        self.assertEqual(self.stock(meds[2]), meds[2].stock_quantity - 3)
+        self.assertEqual(Sale.objects.filter(medicine__in=meds[:3]).count(), 3)
+        self.assertEqual(list(Notification.objects.order_by('id').values_list('verb', flat=True)),
+                         ['order_approved', 'approval_accepted', 'order_shipped', 'order_confirmed_received'])
+
+        self.client.force_authenticate(self.pharmacies[0])
+        response = self.client.post(f'/api/inventory/orders/{order.id}/complete/')
+        self.assertEqual(response.data['detail'], 'Order already completed')
+
+    def test_stale_order_cannot_transition(self):
+        order, meds = self.make_order([1])
+        stale = Order.objects.get(pk=order.pk)
+        workflow.transition(Order.objects.get(pk=order.pk), 'approve', self.pharmacies[0])
+        with self.assertRaises(workflow.TransitionError) as cm:
+            workflow.transition(stale, 'reject', self.pharmacies[0])
+        self.assertEqual(cm.exception.status_code, 409)
+        self.assertEqual(self.stock(meds[0]), meds[0].stock_quantity - 1)
+
+    def test_saving_an_order_does_not_reread_it(self):
+        order, _ = self.make_order([1])
+        order = Order.objects.get(pk=order.pk)
+        order.customer_name = 'x'
+        with self.assertNumQueries(1):
+            order.save()
+
+
+class BatchTransitionTests(InventoryTestCase):
+    url = '/api/inventory/orders/batch-transition/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.pharmacies[0])
+
+    def batch(self, action, order_ids):
+        return self.client.post(self.url, {'action': action, 'order_ids': order_ids}, format='json')
+
+    def test_partial_batch_never_oversells(self):
+        small = [self.make_order([1, 1])[0] for _ in range(20)]
+        big, meds = self.make_order([1, 5])
+        other = self.make_order([1], pharmacy=1)[0]
+        ids = [order.id for order in small] + [big.id, other.id, 999999]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.batch('approve', ids)
+        self.assertEqual(response.status_code, 200, response.data)
+        queries = [q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertLessEqual(len(queries), 10)
+
+        # medicine 0 holds 10: the first ten orders fit, everything after is refused
+        self.assertEqual((self.stock(meds[0]), self.stock(meds[1])), (0, 3))
+        self.assertEqual(len(response.data['succeeded']), 10)
+        failed = {f['order_id']: f for f in response.data['failed']}
+        self.assertEqual(len(failed), 13)
+        self.assertEqual(failed[999999]['status_code'], 404)
+        self.assertEqual(failed[other.id]['status_code'], 403)
+        self.assertIn(meds[0].name, failed[big.id]['error'])
+        self.assertEqual(Order.objects.filter(status='approved', stock_reserved=True).count(), 10)
+        self.assertEqual(Notification.objects.filter(verb='order_approved').count(), 10)
+
+        response = self.batch('reject', response.data['succeeded'])
+        self.assertEqual(len(response.data['succeeded']), 10)
+        self.assertEqual((self.stock(meds[0]), self.stock(meds[1])), (meds[0].stock_quantity, meds[1].stock_quantity))
+        self.assertFalse(Order.objects.filter(stock_reserved=True).exists())
+
+    def test_invalid_transitions_fail_per_order(self):
+        ids = [self.make_order([1])[0].id for _ in range(3)]
+        self.assertEqual(len(self.batch('ship', ids).data['failed']), 3)
+
+    def test_patient_actions_are_refused(self):
+        self.assertEqual(self.batch('accept', [1]).status_code, 400)
+
+
+class ReservationExpiryTests(InventoryTestCase):
+    def test_stale_reservations_are_released(self):
+        self.client.force_authenticate(self.pharmacies[0])
+        stale = []
+        for _ in range(5):
+            order, meds = self.make_order([1, 2])
+            self.assertEqual(self.client.post(f'/api/inventory/orders/{order.id}/approve/').status_code, 200)
+            stale.append(order.id)
+        fresh, _ = self.make_order([1])
+        self.assertEqual(self.client.post(f'/api/inventory/orders/{fresh.id}/approve/').status_code, 200)
+        before = self.stock(meds[0])
+        Order.objects.filter(id__in=stale).update(updated_at=timezone.now() - timedelta(days=3))
+
+        out = StringIO()
+        call_command('release_expired_reservations', '--chunk-size', '2', stdout=out)
+        self.assertIn('Released 5', out.getvalue())
+        self.assertEqual(self.stock(meds[0]), before + 5)
+        self.assertEqual(set(Order.objects.filter(status='cancelled', stock_reserved=False).values_list('id', flat=True)), set(stale))
+        self.assertEqual(Order.objects.get(id=fresh.id).status, 'approved')
+        self.assertEqual(Notification.objects.filter(verb='order_reservation_expired').count(), 5)
+        self.assertLedgerBalanced()
+
+    def test_nothing_to_release(self):
+        self.assertEqual(workflow.release_expired(), 0)
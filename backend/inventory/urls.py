@@ -5,6 +5,10 @@ urlpatterns = [
     path('dashboard-stats/', views.dashboard_stats, name='dashboard_stats'),
     path('medicines/', views.medicine_list, name='medicine_list'),
     path('medicines/<int:pk>/', views.medicine_detail, name='medicine_detail'),
+    path('medicines/cache-stats/', views.catalogue_cache_stats, name='catalogue_cache_stats'),
+    path('medicines/import/', views.medicine_import, name='medicine_import'),
+    path('medicines/adjust-stock/', views.adjust_stock, name='adjust_stock'),
+    path('medicines/export/', views.medicine_export, name='medicine_export'),
     
     path('medicines/low-stock/', views.low_stock_medicines, name='low_stock_medicines'),
     path('medicines/expiring-soon/', views.expiring_medicines, name='expiring_medicines'),
@@ -12,6 +16,7 @@ urlpatterns = [
     path('orders/<int:pk>/', views.order_detail, name='order_detail'),
     path('orders/place/', views.place_order, name='place_order'),
     path('orders/my/', views.my_orders, name='my_orders'),
+    path('orders/batch-transition/', views.batch_transition_orders, name='batch_transition_orders'),
     path('orders/<int:order_id>/approve/', views.approve_order, name='approve_order'),
     path('orders/<int:order_id>/reject/', views.reject_order, name='reject_order'),
     path('orders/<int:order_id>/ship/', views.mark_shipped, name='mark_shipped'),
@@ -21,6 +26,8 @@ urlpatterns = [
     path('notifications/', views.notifications_list, name='notifications_list'),
     path('notifications/<int:pk>/mark-read/', views.notification_mark_read, name='notification_mark_read'),
      path('sell/', views.sell_medicine, name='inventory-sell'),
+    path('sell/basket/', views.sell_basket, name='sell_basket'),
+    path('sell/sync/', views.sync_sales, name='sync_sales'),
     path('sales/', views.pharmacy_sales, name='pharmacy_sales'),
     path('customers/', views.customers_list, name='customers_list'),
 ]
\ No newline at end of file
@@ -1,63 +1,138 @@
-from rest_framework.decorators import api_view, permission_classes
-import math
-from rest_framework.permissions import IsAuthenticated,IsAuthenticatedOrReadOnly
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated,IsAuthenticatedOrReadOnly,IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum, F
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import Sum, F, Prefetch
 from inventory.models import Medicine
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from decimal import Decimal
-from datetime import timedelta, date
-
-from .models import Order,Pharmacy,Sale,OrderItem
-from .models import Pharmacy as InventoryPharmacy
-from .serializers import MedicineSerializer, OrderSerializer, SellRequestSerializer
-from django.core.mail import send_mail
+from datetime import timedelta, date, datetime
+
+from .models import Order,Sale,OrderItem, StaleMedicineError
+from .serializers import BasketSaleSerializer, MedicineSerializer, OrderSerializer, OrderWithItemsSerializer, SaleSyncSerializer, StockAdjustmentSerializer, medicine_rows
+from .spatial import pharmacy_index, haversine_km
+from .pagination import wants_page, page_limit, keyset_page, ranked_page
+from .search import search as search_medicines, SEARCH_FIELDS
+from .conditional import fingerprint, make_etag, not_modified, precondition_met, tagged
+from .bulk import import_medicines, export_medicines, parse_csv, parse_ndjson
+from .renderers import CSVRenderer, NDJSONRenderer
+from . import cache as catalogue_cache
+from . import stock
+from . import workflow
+from . import outbox
+from . import pharmacies
+from .idempotency import idempotent
+from .customers import normalize_email, normalize_phone
 from django.conf import settings
 from django.contrib.auth import get_user_model
 import re
 
 
 def _get_or_create_customer(customer_name: str | None, customer_email: str | None, customer_phone: str | None):
-    """Normalize identifiers and try to find an existing Customer, creating one if needed.
-    Matching priority: email (lowercased) -> phone (digits only) -> name.
-    Returns a Customer instance or None if creation failed.
+    """Find the Customer for these identifiers, creating one if needed.
+    Matching priority: email (lowercased) -> phone (digits only) -> name. Email and
+    phone are unique normalized columns, so each lookup is one index probe; a create
+    that loses a race to a concurrent insert falls back to the winner's row.
+    Returns a Customer instance, or None if nothing identifies the customer.
     """
     from .models import Customer
-    try:
-        email = (customer_email or '').strip().lower() if customer_email else None
-        phone = None
-        if customer_phone:
-            # normalize phone by keeping digits only
-            digits = re.sub(r"\D", "", str(customer_phone))
-            phone = digits if digits else None
+    email = normalize_email(customer_email)
+    phone = normalize_phone(customer_phone)
+    name = (customer_name or '').strip()
 
-        name = (customer_name or '').strip() or None
-
-        if email:
-            obj, _ = Customer.objects.get_or_create(email=email, defaults={'name': name or '', 'phone': customer_phone})
+    if email:
+        obj = Customer.objects.filter(email_lower=email).first()
+        if obj:
             return obj
 
-        if phone:
-            # try to find by phone (may have stored with formatting)
-            obj = Customer.objects.filter(phone__iregex=r"\D*" + re.sub(r"(\d)", r"\\1", phone) + r"\D*").first()
-            if obj:
-                return obj
-            obj, _ = Customer.objects.get_or_create(phone=customer_phone, defaults={'name': name or '', 'email': customer_email})
+    if phone:
+        obj = Customer.objects.filter(phone_digits=phone).first()
+        if obj:
+            # a known phone with a new email is the same customer; keep the first email it gave
+            if email and not obj.email:
+                obj.email = customer_email.strip()
+                try:
+                    with transaction.atomic():
+                        obj.save(update_fields=['email'])
+                except IntegrityError:
+                    return Customer.objects.filter(email_lower=email).first() or obj
             return obj
 
-        if name:
-            obj, _ = Customer.objects.get_or_create(name=name, defaults={'phone': customer_phone or '', 'email': customer_email})
-            return obj
-    except Exception:
+    if email or phone:
         try:
-            # last-resort create without uniqueness guarantees
-            return Customer.objects.create(name=customer_name or '', email=customer_email or None, phone=customer_phone or None)
-        except Exception:
-            return None
+            with transaction.atomic():
+                return Customer.objects.create(name=name, email=customer_email.strip() if email else None, phone=customer_phone if phone else None)
+        except IntegrityError:
+            obj = email and Customer.objects.filter(email_lower=email).first()
+            return obj or (phone and Customer.objects.filter(phone_digits=phone).first()) or None
+
+    if name:
+        obj = Customer.objects.filter(name=name).order_by('id').first()
+        return obj or Customer.objects.create(name=name)
+    return None
+
+
+def _parse_timestamp(value, end_of_day=False):
+    """Parse an ISO date or datetime query parameter into an aware datetime (None if malformed).
+    A bare date means the start of that day, or its last instant when end_of_day is set.
+    """
+    # an unencoded '+' in the UTC offset arrives as a space
+    value = value.strip().replace(' ', '+')
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            parsed = datetime.combine(day, datetime.max.time() if end_of_day else datetime.min.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 
+def _list_orders(request, orders):
+    """GET handler shared by order_list and my_orders.
+
+    Filters: ?status=a,b  ?from=  ?to= (ISO dates or datetimes on created_at).
+    ?expand=items nests each order's line items (two queries for the whole page).
+    ?limit / ?cursor switch to {'results', 'next'} pages ordered newest first.
+    """
+    params = request.query_params
+    statuses = [value for value in params.get('status', '').split(',') if value]
+    if statuses:
+        orders = orders.filter(status__in=statuses)
+    for param, lookup, end_of_day in (('from', 'created_at__gte', False), ('to', 'created_at__lte', True)):
+        if params.get(param):
+            when = _parse_timestamp(params[param], end_of_day=end_of_day)
+            if when is None:
+                return Response({'error': f'{param} must be an ISO date or datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            orders = orders.filter(**{lookup: when})
+
+    etag = make_etag(request, fingerprint(orders))
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
+    expand = params.get('expand') == 'items'
+    serializer_class = OrderWithItemsSerializer if expand else OrderSerializer
+    if expand:
+        orders = orders.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.select_related('medicine__pharmacy').order_by('id'))
+        )
+
+    if not wants_page(request):
+        return tagged(Response(serializer_class(orders.order_by('-created_at', '-id'), many=True).data), etag)
+    try:
+        page, next_cursor = keyset_page(orders, ('-created_at', '-id'), params.get('cursor'), page_limit(request))
+    except ValueError:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    return tagged(Response({'results': serializer_class(page, many=True).data, 'next': next_cursor}), etag)
 
 
 def _display_name(user):
@@ -99,7 +174,7 @@ def dashboard_stats(request):
     if user.user_type != 'pharmacy':
         return Response({'error': 'Pharmacy access only'}, status=403)
 
-    inv_pharm = InventoryPharmacy.objects.filter(user=user).first()
+    inv_pharm = pharmacies.resolve(user, request, create=False)
     if not inv_pharm:
         return Response({'error': 'Pharmacy profile not found for user'}, status=403)
 
@@ -179,27 +254,54 @@ def dashboard_stats(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def pharmacy_sales(request):
-    """Return recent sales for the authenticated pharmacy user."""
+    """Return sales of the authenticated pharmacy user, newest first.
+
+    Filters: ?from= ?to= (ISO dates or datetimes on sale_date), ?medicine_id=, ?customer_id=.
+    Without ?limit / ?cursor the latest 50 come back as a plain list; with them,
+    {'results', 'next'} pages reach back through the whole history.
+    """
     user = request.user
     if user.user_type != 'pharmacy':
         return Response({'error': 'Pharmacy access only'}, status=403)
 
-    inv_pharm = InventoryPharmacy.objects.filter(user=user).first()
+    inv_pharm = pharmacies.resolve(user, request, create=False)
     if not inv_pharm:
         return Response({'error': 'Pharmacy profile not found for user'}, status=403)
 
-    qs = Sale.objects.filter(pharmacy=inv_pharm).order_by('-sale_date')[:50]
-    data = []
-    for s in qs:
-        data.append({
-            'id': s.id,
-            'medicine': getattr(s.medicine, 'name', None),
-            'quantity': s.quantity,
-            'total_price': float(s.total_price),
-            'customer': {'id': s.customer.id, 'name': s.customer.name} if s.customer else None,
-            'sale_date': s.sale_date,
-        })
-    return Response(data)
+    params = request.query_params
+    sales = Sale.objects.filter(pharmacy=inv_pharm)
+    for param, lookup, end_of_day in (('from', 'sale_date__gte', False), ('to', 'sale_date__lte', True)):
+        if params.get(param):
+            when = _parse_timestamp(params[param], end_of_day=end_of_day)
+            if when is None:
+                return Response({'error': f'{param} must be an ISO date or datetime'}, status=status.HTTP_400_BAD_REQUEST)
+            sales = sales.filter(**{lookup: when})
+    for param in ('medicine_id', 'customer_id'):
+        if params.get(param):
+            try:
+                sales = sales.filter(**{param: int(params[param])})
+            except ValueError:
+                return Response({'error': f'{param} must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    sales = sales.select_related('medicine', 'customer')
+
+    if not wants_page(request):
+        return Response([_sale_row(s) for s in sales.order_by('-sale_date', '-id')[:50]])
+    try:
+        page, next_cursor = keyset_page(sales, ('-sale_date', '-id'), params.get('cursor'), page_limit(request))
+    except ValueError:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': [_sale_row(s) for s in page], 'next': next_cursor})
+
+
+def _sale_row(s):
+    return {
+        'id': s.id,
+        'medicine': getattr(s.medicine, 'name', None),
+        'quantity': s.quantity,
+        'total_price': float(s.total_price),
+        'customer': {'id': s.customer.id, 'name': s.customer.name} if s.customer else None,
+        'sale_date': s.sale_date,
+    }
 
 
 @api_view(['GET'])
@@ -220,9 +322,9 @@ def expiring_medicines(request):
         expiry_date__gte=today  # Don't include already expired medicines
     ).order_by('expiry_date')
 
-    data = []
-    for medicine in medicines:
-        days_until_expiry = (medicine.expiry_date - today).days
+    data = medicine_rows(medicines)
+    for serializer_data in data:
+        days_until_expiry = (date.fromisoformat(serializer_data['expiry_date']) - today).days
         
         # Categorize expiration level
         if days_until_expiry <= 0:
@@ -238,14 +340,12 @@ def expiring_medicines(request):
             level = 'normal'
             message = f'Expires in {days_until_expiry} days'
 
-        serializer_data = MedicineSerializer(medicine).data
         serializer_data.update({
             'days_until_expiry': days_until_expiry,
             'expiration_level': level,
             'expiration_message': message,
             'is_expiring_soon': True
         })
-        data.append(serializer_data)
 
     return Response(data)
 
@@ -260,7 +360,7 @@ def customers_list(request):
     from django.db.models import Sum, Count, Max
 
     customers = {}
-    inv_pharm = InventoryPharmacy.objects.filter(user=user).first()
+    inv_pharm = pharmacies.resolve(user, request, create=False)
     if not inv_pharm:
         return Response({'error': 'Pharmacy profile not found for user'}, status=403)
     def _norm_key(email: str | None, phone: str | None, name: str | None):
@@ -343,89 +443,113 @@ def customers_list(request):
 @api_view(['GET', 'POST'])
 def medicine_list(request):
     if request.method == 'GET':
-        today = timezone.localdate()
-
-        if not request.user.is_authenticated:
-            medicines = Medicine.objects.filter(
-                stock_quantity__gt=0
-            ).filter(
-                Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
-            )
-            search = request.query_params.get('search', '')
-            if search:
-                medicines = medicines.filter(
-                    Q(name__icontains=search) |
-                    Q(generic_name__icontains=search) |
-                    Q(category__icontains=search)
-                )
-
-        elif request.user.user_type == 'patient':
-            medicines = Medicine.objects.filter(
-                stock_quantity__gt=0
-            ).filter(
-                Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
-            )
-            search = request.query_params.get('search', '')
-            if search:
-                medicines = medicines.filter(
-                    Q(name__icontains=search) |
-                    Q(generic_name__icontains=search) |
-                    Q(category__icontains=search)
-                )
-            print(f"Patient search: '{search}', Found: {medicines.count()} medicines")  
+        role = request.user.user_type if request.user.is_authenticated else 'anonymous'
+        search = ' '.join(request.query_params.get('search', '').split())
 
+        if role != 'pharmacy':
+            medicines = Medicine.objects.available_for_patient()
         else:
             medicines = Medicine.objects.filter(pharmacy=request.user)
-            search = request.query_params.get('search', '')
-            if search:
-                medicines = medicines.filter(
-                    Q(name__icontains=search) |
-                    Q(generic_name__icontains=search)
-                )
-            print(f"Pharmacy view: Found {medicines.count()} medicines")  
-
-        serializer = MedicineSerializer(medicines, many=True)
-        data = serializer.data
+
+        state = fingerprint(medicines)
+        etag = make_etag(request, role, state)
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+
+        if search:
+            fields = ('name', 'generic_name') if role == 'pharmacy' else SEARCH_FIELDS
+            medicines = search_medicines(medicines, search, fields=fields)
+
         try:
             lat = float(request.query_params.get('latitude')) if request.query_params.get('latitude') else None
             lon = float(request.query_params.get('longitude')) if request.query_params.get('longitude') else None
         except (ValueError, TypeError):
             lat = lon = None
+        try:
+            radius = float(request.query_params.get('radius')) if request.query_params.get('radius') else None
+        except (ValueError, TypeError):
+            radius = None
+        by_distance = lat is not None and lon is not None
+        if not by_distance:
+            radius = None
+
+        distances = {}
+
+        def distance_to(pharmacy_id):
+            if pharmacy_id not in distances:
+                coords = pharmacy_index.coords(pharmacy_id)
+                distances[pharmacy_id] = haversine_km(lat, lon, coords[0], coords[1]) if coords else None
+            return distances[pharmacy_id]
+
+        paginate = wants_page(request)
+        limit = page_limit(request)
+        cursor = request.query_params.get('cursor')
+
+        # anonymous/patient results are shared across users; distance-ordered pages are per point
+        cache_key = None
+        tile = catalogue_cache.tile(lat, lon) if radius is not None else None
+        if role != 'pharmacy' and not (paginate and by_distance):
+            cache_key = catalogue_cache.key(role, search, tile, radius, cursor if paginate else None, limit if paginate else None, state)
+        cached = catalogue_cache.lookup(cache_key) if cache_key else None
+
+        if cached is not None:
+            data, next_cursor = cached['rows'], cached['next']
+        else:
+            if radius is not None:
+                if cache_key:
+                    # widen the radius to cover the whole tile; the exact radius is applied below
+                    center_lat, center_lon, margin = catalogue_cache.tile_center(tile)
+                    in_range = pharmacy_index.within(center_lat, center_lon, radius + margin)
+                else:
+                    in_range = pharmacy_index.within(lat, lon, radius)
+                    distances.update(in_range)
+                medicines = medicines.filter(pharmacy_id__in=list(in_range))
+
+            next_cursor = None
+            if paginate:
+                try:
+                    if by_distance:
+                        # rank the (few) pharmacies by distance; the database pages medicines in that order
+                        pharmacy_ids = medicines.order_by().values_list('pharmacy_id', flat=True).distinct()
+                        page, next_cursor = ranked_page(medicines, 'pharmacy_id', {ph_id: distance_to(ph_id) for ph_id in pharmacy_ids}, cursor, limit)
+                        page_ids = [row['id'] for row in page]
+                    else:
+                        ordering = ('-search_rank', '-id') if search else ('-created_at', '-id')
+                        keys = medicines.values(*(field.lstrip('-') for field in ordering))
+                        page, next_cursor = keyset_page(keys, ordering, cursor, limit)
+                        page_ids = [row['id'] for row in page]
+                except ValueError:
+                    return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+                position = {med_id: i for i, med_id in enumerate(page_ids)}
+                data = sorted(medicine_rows(Medicine.objects.filter(id__in=page_ids)), key=lambda row: position[row['id']])
+            else:
+                data = medicine_rows(medicines)
+            if cache_key:
+                catalogue_cache.store(cache_key, {'rows': data, 'next': next_cursor})
+
+        if cache_key and radius is not None:
+            in_radius = []
+            for item in data:
+                distance = distance_to(item.get('pharmacy'))
+                if distance is not None and distance <= radius:
+                    in_radius.append(item)
+            data = in_radius
 
-        enriched = []
         for item in data:
-            pharmacy_coords = None
-            distance_km = None
-            try:
-                inv_pharm = Pharmacy.objects.filter(user_id=item.get('pharmacy')).first()
-                if inv_pharm:
-                    pharmacy_coords = (float(inv_pharm.latitude or 0.0), float(inv_pharm.longitude or 0.0))
-            except Exception:
-                pharmacy_coords = None
+            pharmacy_coords = pharmacy_index.coords(item.get('pharmacy'))
+            if pharmacy_coords:
+                item['pharmacy_latitude'] = pharmacy_coords[0]
+                item['pharmacy_longitude'] = pharmacy_coords[1]
+                if by_distance:
+                    item['distance_km'] = round(distance_to(item.get('pharmacy')), 3)
+        if by_distance and not paginate:
+            data.sort(key=lambda x: x.get('distance_km') if x.get('distance_km') is not None else float('inf'))
 
-            if lat is not None and lon is not None and pharmacy_coords:
-                try:
-                    R = 6371.0
-                    dlat = math.radians(pharmacy_coords[0] - lat)
-                    dlon = math.radians(pharmacy_coords[1] - lon)
-                    a = (math.sin(dlat/2) ** 2) + math.cos(math.radians(lat)) * math.cos(math.radians(pharmacy_coords[0])) * (math.sin(dlon/2) ** 2)
-                    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-                    distance_km = R * c
-                except Exception:
-                    distance_km = None
+        if paginate:
+            return tagged(Response({'results': data, 'next': next_cursor}), etag)
+        return tagged(Response(data), etag)
 
-            new_item = dict(item)
-            if pharmacy_coords:
-                new_item['pharmacy_latitude'] = pharmacy_coords[0]
-                new_item['pharmacy_longitude'] = pharmacy_coords[1]
-            if distance_km is not None:
-                new_item['distance_km'] = round(distance_km, 3)
-            enriched.append(new_item)
-        if lat is not None and lon is not None:
-            enriched.sort(key=lambda x: x.get('distance_km') if x.get('distance_km') is not None else float('inf'))
-
-        return Response(enriched)
-    
     elif request.method == 'POST':
         if not request.user.is_authenticated:
             return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -435,10 +559,93 @@ def medicine_list(request):
         
         serializer = MedicineSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(pharmacy=request.user)
+            try:
+                with transaction.atomic():
+                    serializer.save(pharmacy=request.user)
+            except IntegrityError:
+                return Response({'error': 'A medicine with this name, dosage and expiry date already exists'}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def medicine_import(request):
+    """Bulk create/update medicines from a CSV (text/csv) or NDJSON (application/x-ndjson) body.
+    Rows are matched on (name, dosage, expiry_date); invalid rows are reported and skipped.
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Only pharmacies can import medicines'}, status=status.HTTP_403_FORBIDDEN)
+
+    content_type = (request.content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        parser = parse_csv
+    elif content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        parser = parse_ndjson
+    else:
+        return Response({'error': 'Send the file as text/csv or application/x-ndjson'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    stream = request.stream
+    summary = import_medicines(request.user, parser(stream) if stream is not None else iter(()))
+    return Response(summary)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([CSVRenderer, NDJSONRenderer])
+def medicine_export(request):
+    """Stream the pharmacy's whole inventory as ?format=csv (default) or ?format=ndjson.
+    ?updated_since=<ISO date or datetime> limits the export to rows changed since then.
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Only pharmacies can export medicines'}, status=status.HTTP_403_FORBIDDEN)
+
+    medicines = Medicine.objects.filter(pharmacy=request.user)
+    since = request.query_params.get('updated_since')
+    if since:
+        parsed = _parse_timestamp(since)
+        if parsed is None:
+            return Response({'error': 'updated_since must be an ISO date or datetime'}, status=status.HTTP_400_BAD_REQUEST)
+        medicines = medicines.filter(updated_at__gte=parsed)
+
+    renderer = request.accepted_renderer
+    response = StreamingHttpResponse(export_medicines(medicines, renderer.format), content_type=f'{renderer.media_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="medicines.{renderer.format}"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def adjust_stock(request):
+    """Apply many stock changes at once: body is a list of {id, delta} or {id, absolute}.
+    All changes are applied in one transaction or none are.
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Only pharmacies can adjust stock'}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = StockAdjustmentSerializer(data=request.data, many=True)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ids = [item['id'] for item in serializer.validated_data]
+    if len(set(ids)) != len(ids):
+        return Response({'error': 'Each medicine may appear only once'}, status=status.HTTP_400_BAD_REQUEST)
+
+    deltas = {item['id']: item['delta'] for item in serializer.validated_data if 'delta' in item}
+    levels = {item['id']: item['absolute'] for item in serializer.validated_data if 'absolute' in item}
+    try:
+        quantities = stock.apply(deltas=deltas, levels=levels, pharmacy=request.user)
+    except stock.StockError as e:
+        code = status.HTTP_404_NOT_FOUND if str(e) == 'Medicine not found' else status.HTTP_400_BAD_REQUEST
+        return Response({'error': str(e), 'medicine_ids': e.medicine_ids}, status=code)
+    return Response([{'id': pk, 'stock_quantity': quantities[pk]} for pk in ids])
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalogue_cache_stats(request):
+    """Hit/miss counters of the patient catalogue response cache."""
+    return Response(catalogue_cache.stats())
+
+
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def medicine_detail(request, pk):
@@ -449,15 +656,31 @@ def medicine_detail(request, pk):
     except Medicine.DoesNotExist:
         return Response({'error': 'Medicine not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    etag = make_etag(request, medicine.version)
     if request.method == 'GET':
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
         serializer = MedicineSerializer(medicine)
-        return Response(serializer.data)
+        return tagged(Response(serializer.data), etag)
 
-    elif request.method in ('PUT', 'PATCH'):
+    # If-Match (or a "version" in the body) names the version the client edited
+    expected = request.data.get('version') if request.method != 'DELETE' and isinstance(request.data, dict) else None
+    if not precondition_met(request, etag) or (expected is not None and str(expected) != str(medicine.version)):
+        return _medicine_conflict(request, medicine)
+
+    if request.method in ('PUT', 'PATCH'):
         serializer = MedicineSerializer(medicine, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except StaleMedicineError:
+                medicine.refresh_from_db()
+                return _medicine_conflict(request, medicine)
+            except IntegrityError:
+                return Response({'error': 'A medicine with this name, dosage and expiry date already exists'}, status=status.HTTP_400_BAD_REQUEST)
+            return tagged(Response(serializer.data), make_etag(request, medicine.version))
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
@@ -465,6 +688,14 @@ def medicine_detail(request, pk):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def _medicine_conflict(request, medicine):
+    """409 carrying the medicine as it is now, so the client can merge and retry."""
+    return tagged(Response(
+        {'error': 'Medicine was changed by another request; reload and try again', 'current': MedicineSerializer(medicine).data},
+        status=status.HTTP_409_CONFLICT,
+    ), make_etag(request, medicine.version))
+
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -472,12 +703,16 @@ def low_stock_medicines(request):
     if request.user.user_type != 'pharmacy':
         return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
     
+    etag = make_etag(request, fingerprint(Medicine.objects.filter(pharmacy=request.user)))
+    unchanged = not_modified(request, etag)
+    if unchanged:
+        return unchanged
+
     medicines = Medicine.objects.filter(
         pharmacy=request.user,
         stock_quantity__lte=F('minimum_stock')
     )
-    serializer = MedicineSerializer(medicines, many=True)
-    return Response(serializer.data)
+    return tagged(Response(medicine_rows(medicines)), etag)
 
 
 @api_view(['GET', 'POST'])
@@ -487,9 +722,7 @@ def order_list(request):
         return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
 
     if request.method == 'GET':
-        orders = Order.objects.filter(pharmacy=request.user).order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        return _list_orders(request, Order.objects.filter(pharmacy=request.user))
 
     return Response({'detail': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -514,7 +747,7 @@ def order_detail(request, pk):
         return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
         
     try:
-        order = Order.objects.get(pk=pk, pharmacy=request.user)
+        order = Order.objects.select_related('pharmacy', 'patient').get(pk=pk, pharmacy=request.user)
     except Order.DoesNotExist:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -525,65 +758,20 @@ def order_detail(request, pk):
     elif request.method == 'PUT':
     
         requested_status = request.data.get('status')
-
-
+        action = None
         if requested_status in ('approved', 'completed') and order.status == 'pending':
-            from .models import Medicine as InventoryMedicine, Notification
-            items = OrderItem.objects.filter(order=order)
+            action = 'approve'
+        elif requested_status == 'rejected' and order.status in ('pending', 'approved'):
+            action = 'reject'
+        if action:
             try:
-                with transaction.atomic():
-                    for it in items.select_for_update():
-                        med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                        if med.stock_quantity < it.quantity:
-                            return Response({'error': f'Insufficient stock for {med.name}'}, status=status.HTTP_400_BAD_REQUEST)
-
-                    for it in items:
-                        med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                        med.stock_quantity = med.stock_quantity - it.quantity
-                        med.save()
-
-                    order.stock_reserved = True
-                    order.status = 'approved'
-                    order.save()
-
-                  
-                    if order.patient:
-                        try:
-                            Notification.objects.create(
-                                recipient=order.patient,
-                                actor=request.user,
-                                verb='order_approved',
-                                message=f'Your order #{order.id} has been approved by {_display_name(order.pharmacy)}.',
-                                data={'order_id': order.id}
-                            )
-                        except Exception:
-                            pass
-
-                serializer = OrderSerializer(order)
-                return Response(serializer.data)
+                workflow.transition(order, action, request.user)
+            except workflow.TransitionError as e:
+                return Response({'error': str(e)}, status=e.status_code)
             except Exception as e:
-                return Response({'error': 'Failed to reserve stock', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                return Response({'error': 'Failed to update order stock', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(OrderSerializer(order).data)
 
-     
-        if requested_status == 'rejected' and order.status in ('pending', 'approved'):
-            from .models import Medicine as InventoryMedicine
-            if order.stock_reserved:
-                try:
-                    with transaction.atomic():
-                        items = OrderItem.objects.select_for_update().filter(order=order)
-                        for it in items:
-                            med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                            med.stock_quantity = med.stock_quantity + it.quantity
-                            med.save()
-                        order.stock_reserved = False
-                        order.status = 'rejected'
-                        order.save()
-                    serializer = OrderSerializer(order)
-                    return Response(serializer.data)
-                except Exception as e:
-                    return Response({'error': 'Failed to restore stock', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-     
         serializer = OrderSerializer(order, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -597,6 +785,7 @@ def order_detail(request, pk):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def place_order(request):
     """Place an order as a patient. Payload:
     { "pharmacy_id": 2, "items": [{"medicine_id": 1, "quantity": 2}], "customer_name": "...", "customer_phone": "..." }
@@ -623,296 +812,162 @@ def place_order(request):
     except User.DoesNotExist:
         return Response({'error': 'Pharmacy not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    order = Order.objects.create(pharmacy=pharmacy_user, patient=request.user, customer_name=customer_name, customer_phone=customer_phone, total_amount=0, status='pending')
-
-    total = Decimal('0')
-    created_items = []
+    lines = []
     for it in items:
-        med_id = it.get('medicine_id')
         qty = int(it.get('quantity', 0) or 0)
-        if qty <= 0:
-            continue
+        if qty > 0:
+            lines.append((it.get('medicine_id'), qty))
+
+    wanted = []
+    for med_id, _ in lines:
         try:
-            med = Medicine.objects.get(pk=med_id, pharmacy=pharmacy_user)
-        except Medicine.DoesNotExist:
-            order.delete()
+            wanted.append(int(med_id))
+        except (TypeError, ValueError):
             return Response({'error': f'Medicine {med_id} not found for this pharmacy'}, status=status.HTTP_400_BAD_REQUEST)
+    medicines = Medicine.objects.filter(pharmacy=pharmacy_user).only('id', 'unit_price').order_by().in_bulk(wanted)
 
-        unit_price = getattr(med, 'unit_price', 0) or 0
+    total = Decimal('0')
+    order_items = []
+    created_items = []
+    for med_id, (_, qty) in zip(wanted, lines):
+        med = medicines.get(med_id)
+        if med is None:
+            return Response({'error': f'Medicine {med_id} not found for this pharmacy'}, status=status.HTTP_400_BAD_REQUEST)
+        unit_price = med.unit_price or 0
         subtotal = Decimal(unit_price) * qty
-        OrderItem.objects.create(order=order, medicine=med, quantity=qty, unit_price=unit_price, subtotal=subtotal)
+        order_items.append(OrderItem(medicine=med, quantity=qty, unit_price=unit_price, subtotal=subtotal))
         total += subtotal
         created_items.append({'medicine_id': med.id, 'quantity': qty})
 
-    order.total_amount = total
-    order.save()
+    with transaction.atomic():
+        order = Order.objects.create(pharmacy=pharmacy_user, patient=request.user, customer_name=customer_name, customer_phone=customer_phone, total_amount=total, status='pending')
+        for item in order_items:
+            item.order = order
+        OrderItem.objects.bulk_create(order_items)
 
-    try:
+        # queued with the order and sent by manage.py run_outbox
         subject = f'New order #{order.id} placed'
         message = f'New order {order.id} has been placed by {_display_name(request.user)}.\nPlease review orders in your dashboard.'
         from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
         recipient = [pharmacy_user.email] if getattr(pharmacy_user, 'email', None) else None
         if recipient and from_email:
-            send_mail(subject, message, from_email, recipient, fail_silently=True)
-    except Exception:
-        pass
+            outbox.enqueue(subject, message, recipient, from_email)
 
     return Response({'order_id': order.id, 'items': created_items, 'total': float(total), 'status': order.status}, status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def approve_order(request, order_id):
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
-        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+def batch_transition_orders(request):
+    """Apply one action to many orders: { "action": "approve", "order_ids": [1, 2, 3] }.
+    action is approve, reject, ship or complete. Orders that cannot make the transition
+    are reported in 'failed'; the others still go through.
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
 
-    if request.user != order.pharmacy:
-        try:
-            user_id = getattr(request.user, 'id', None)
-            user_type = getattr(request.user, 'user_type', None)
-        except Exception:
-            user_id = None
-            user_type = None
-        try:
-            order_pharmacy_id = getattr(order.pharmacy, 'id', None)
-            order_pharmacy_type = getattr(order.pharmacy, 'user_type', None)
-        except Exception:
-            order_pharmacy_id = None
-            order_pharmacy_type = None
-        return Response(
-            {
-                'error': 'Unauthorized',
-                'user_id': user_id,
-                'user_type': user_type,
-                'order_pharmacy_id': order_pharmacy_id,
-                'order_pharmacy_type': order_pharmacy_type,
-            },
-            status=status.HTTP_403_FORBIDDEN,
-        )
+    action = request.data.get('action')
+    order_ids = request.data.get('order_ids')
+    if action not in workflow.BATCH_ACTIONS:
+        return Response({'error': f"action must be one of: {', '.join(workflow.BATCH_ACTIONS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(order_ids, list) or not order_ids:
+        return Response({'error': 'order_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(order_ids) > workflow.BATCH_LIMIT:
+        return Response({'error': f'At most {workflow.BATCH_LIMIT} orders per request'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        order_ids = [int(pk) for pk in order_ids]
+    except (TypeError, ValueError):
+        return Response({'error': 'order_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if order.status != 'pending':
-        return Response({'error': 'Only pending orders can be approved'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        succeeded, failures = workflow.batch_transition(order_ids, action, request.user)
+    except stock.StockError as e:
+        return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+    return Response({
+        'action': action,
+        'succeeded': succeeded,
+        'failed': [{'order_id': pk, 'error': str(e), 'status_code': e.status_code} for pk, e in failures.items()],
+    })
 
-    from .models import Medicine as InventoryMedicine
 
-    items = OrderItem.objects.filter(order=order)
+def _load_order(order_id):
     try:
-        with transaction.atomic():
-    
-            for it in items.select_for_update():
-                med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                if med.stock_quantity < it.quantity:
-                    return Response({'error': f'Insufficient stock for {med.name}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Order.objects.select_related('pharmacy', 'patient').get(pk=order_id)
+    except Order.DoesNotExist:
+        return None
 
-        
-            for it in items:
-                med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                med.stock_quantity = med.stock_quantity - it.quantity
-                med.save()
-
-            order.stock_reserved = True
-            order.status = 'approved'
-            order.save()
-    except Exception as e:
-        return Response({'error': 'Failed to reserve stock', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
- 
+def _apply_transition(request, order, action, detail):
+    """Run a workflow transition and turn the outcome into a response."""
     try:
-        from .models import Notification
-        if order.patient:
-            Notification.objects.create(
-                recipient=order.patient,
-                actor=request.user,
-                verb='order_approved',
-                    message=f'Your order #{order.id} has been approved by {_display_name(order.pharmacy)}.',
-                data={'order_id': order.id}
-            )
-    except Exception:
-        pass
-
-    return Response({'detail': 'Order approved and stock reserved for delivery'})
+        workflow.transition(order, action, request.user)
+    except workflow.TransitionError as e:
+        return Response({'error': str(e), 'current_status': order.status}, status=e.status_code)
+    except Exception as e:
+        return Response({'error': f'Failed to {action} order', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({'detail': detail})
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def reject_order(request, order_id):
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+def approve_order(request, order_id):
+    order = _load_order(order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    return _apply_transition(request, order, 'approve', 'Order approved and stock reserved for delivery')
 
-    if request.user != order.pharmacy:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
-    if order.status not in ('pending', 'approved'):
-        return Response({'error': 'Order cannot be rejected at this stage'}, status=status.HTTP_400_BAD_REQUEST)
-
-    from .models import Medicine as InventoryMedicine
 
-    if order.stock_reserved:
-        try:
-            with transaction.atomic():
-                items = OrderItem.objects.select_for_update().filter(order=order)
-                for it in items:
-                    med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                    med.stock_quantity = med.stock_quantity + it.quantity
-                    med.save()
-                order.stock_reserved = False
-                order.status = 'rejected'
-                order.save()
-        except Exception as e:
-            return Response({'error': 'Failed to restore reserved stock', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    else:
-        order.status = 'rejected'
-        order.save()
-
-     
-        try:
-            from .models import Notification
-            if order.patient:
-                Notification.objects.create(
-                    recipient=order.patient,
-                    actor=request.user,
-                    verb='order_rejected',
-                    message=f'Your order #{order.id} was rejected by the pharmacy. If you need help, please contact us.',
-                    data={'order_id': order.id, 'contact_url': '/#contact'}
-                )
-        except Exception:
-
-            pass
-
-        return Response({'detail': 'Order rejected and stock restored (if reserved)'})
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reject_order(request, order_id):
+    order = _load_order(order_id)
+    if order is None:
+        return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+    return _apply_transition(request, order, 'reject', 'Order rejected and stock restored (if reserved)')
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_shipped(request, order_id):
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+    order = _load_order(order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    if request.user != order.pharmacy:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
-    if order.status not in ('approved', 'accepted'):
-        return Response({'error': "Only approved or patient-accepted orders can be marked shipped"}, status=status.HTTP_400_BAD_REQUEST)
-
-    order.status = 'shipped'
-    order.save()
- 
-    try:
-        from .models import Notification
-        if order.patient:
-            Notification.objects.create(
-                recipient=order.patient,
-                actor=request.user,
-                verb='order_shipped',
-                    message=f'Your order #{order.id} has been shipped by {_display_name(order.pharmacy)}.',
-                data={'order_id': order.id}
-            )
-    except Exception:
-        pass
-
-    return Response({'detail': 'Order marked as shipped'})
+    return _apply_transition(request, order, 'ship', 'Order marked as shipped')
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def accept_order_approval(request, order_id):
     """Patient accepts an approved order so pharmacy can proceed to ship/deliver."""
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+    order = _load_order(order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    if request.user != order.patient:
-        return Response({'error': 'Only the ordering patient can accept approval'}, status=status.HTTP_403_FORBIDDEN)
-
-    if order.status != 'approved':
-        return Response({'error': 'Order must be in approved state to accept'}, status=status.HTTP_400_BAD_REQUEST)
-
-    order.status = 'accepted'
-    order.save()
-
-
-    try:
-        from .models import Notification
-        if order.pharmacy:
-            Notification.objects.create(
-                recipient=order.pharmacy,
-                actor=request.user,
-                verb='approval_accepted',
-                    message=f'Patient {_display_name(request.user)} has accepted approval for order #{order.id}.',
-                data={'order_id': order.id}
-            )
-    except Exception:
-        pass
-
-    return Response({'detail': 'Order approval accepted'})
+    return _apply_transition(request, order, 'accept', 'Order approval accepted')
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def complete_order(request, order_id):
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+    order = _load_order(order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
-
-    if request.user != order.pharmacy:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
-    if order.status == 'completed':
+    if order.status == 'completed' and request.user.pk == order.pharmacy_id:
         return Response({'detail': 'Order already completed', 'current_status': order.status})
-
-    if order.status not in ('shipped', 'approved', 'delivered'):
-        return Response({'error': 'Only shipped, delivered or approved orders can be marked completed by pharmacy', 'current_status': order.status}, status=status.HTTP_400_BAD_REQUEST)
-
-    order.status = 'completed'
-    order.save()
-
-    try:
-        from .models import Notification
-        if order.patient:
-            Notification.objects.create(
-                recipient=order.patient,
-                actor=request.user,
-                verb='order_completed_by_pharmacy',
-                    message=f'Your order #{order.id} was marked completed by {_display_name(order.pharmacy)}.',
-                data={'order_id': order.id}
-            )
-    except Exception:
-        pass
-
-    return Response({'detail': 'Order marked completed and patient notified'})
+    return _apply_transition(request, order, 'complete', 'Order marked completed and patient notified')
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def confirm_delivery(request, order_id):
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
+    order = _load_order(order_id)
+    if order is None:
         return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if request.user != order.patient:
-        return Response({'error': 'Only the ordering patient can confirm delivery'}, status=status.HTTP_403_FORBIDDEN)
-
-    if order.status not in ('shipped', 'delivered', 'completed'):
-        return Response({'error': "Order must be 'shipped', 'delivered' or 'completed' before confirming delivery"}, status=status.HTTP_400_BAD_REQUEST)
-
-
-    from .models import Pharmacy as InventoryPharmacy, Medicine as InventoryMedicine, Customer
-
     provided_customer_name = request.data.get('customer_name') if isinstance(request.data, dict) else None
 
     try:
+        workflow.check(order, 'confirm', request.user)
         with transaction.atomic():
-            items = OrderItem.objects.select_for_update().filter(order=order)
-
             try:
                 customer_name_val = provided_customer_name or order.customer_name or _display_name(order.patient) or 'Customer'
             except Exception:
@@ -925,82 +980,9 @@ def confirm_delivery(request, order_id):
             except Exception:
                 customer_obj = None
 
-            if order.stock_reserved:
-              
-                for it in items:
-                    try:
-                       
-                        inv_pharm = None
-                        try:
-                            if getattr(request, 'user', None) and getattr(request.user, 'user_type', '') == 'pharmacy' and request.user == order.pharmacy:
-                                inv_pharm = InventoryPharmacy.objects.filter(user=request.user).first()
-                        except Exception:
-                            inv_pharm = None
-
-                        if not inv_pharm:
-                            inv_pharm = InventoryPharmacy.objects.filter(user_id=getattr(order.pharmacy, 'id', None)).first()
-
-                        if not inv_pharm:
-                            try:
-                                pname = getattr(order.pharmacy, 'name', None) or getattr(order.pharmacy, 'username', None) or (getattr(order.pharmacy, 'email', '') or '').split('@')[0]
-                                inv_pharm, _ = InventoryPharmacy.objects.get_or_create(user_id=order.pharmacy.id, defaults={'name': f"{pname} Pharmacy", 'address': '', 'phone': ''})
-                            except Exception:
-                                inv_pharm = None
-                        if inv_pharm:
-                            Sale.objects.create(pharmacy=inv_pharm, medicine=it.medicine, quantity=it.quantity, total_price=it.subtotal, customer=customer_obj)
-                            try:
-                                print(f"confirm_delivery: order={order.id} created sale for inv_pharm_id={getattr(inv_pharm, 'id', None)} medicine={getattr(it.medicine, 'id', None)} qty={it.quantity}")
-                            except Exception:
-                                pass
-                    except Exception:
-                     
-                        pass
-            else:
-              
-                for it in items:
-                    med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                    if med.stock_quantity < it.quantity:
-                        return Response({'error': f'Insufficient stock to complete delivery for {med.name}'}, status=status.HTTP_400_BAD_REQUEST)
-
-                for it in items:
-                    med = InventoryMedicine.objects.select_for_update().get(pk=it.medicine.id)
-                    med.stock_quantity = med.stock_quantity - it.quantity
-                    med.save()
-                    try:
-                        inv_pharm = InventoryPharmacy.objects.filter(user_id=order.pharmacy.id).first()
-                        if not inv_pharm:
-                            try:
-                                pname = getattr(order.pharmacy, 'name', None) or getattr(order.pharmacy, 'username', None) or (getattr(order.pharmacy, 'email', '') or '').split('@')[0]
-                                inv_pharm, _ = InventoryPharmacy.objects.get_or_create(user_id=order.pharmacy.id, defaults={'name': f"{pname} Pharmacy", 'address': '', 'phone': ''})
-                            except Exception:
-                                inv_pharm = None
-                        if inv_pharm:
-                            Sale.objects.create(pharmacy=inv_pharm, medicine=it.medicine, quantity=it.quantity, total_price=it.subtotal, customer=customer_obj)
-                    except Exception:
-                        pass
-
-        
-            if provided_customer_name:
-                order.customer_name = provided_customer_name
-            order.status = 'completed'
-            order.save()
-
-         
-            try:
-                from .models import Notification
-          
-                if order.pharmacy:
-                    customer_name = provided_customer_name or order.customer_name or _display_name(order.patient)
-                    Notification.objects.create(
-                        recipient=order.pharmacy,
-                        actor=order.patient,
-                        verb='order_confirmed_received',
-                        message=f'Order #{order.id} was received by {customer_name}.',
-                        data={'order_id': order.id, 'customer_name': customer_name}
-                    )
-            except Exception:
-                pass
-
+            workflow.transition(order, 'confirm', request.user, customer=customer_obj, customer_name=provided_customer_name)
+    except workflow.TransitionError as e:
+        return Response({'error': str(e), 'current_status': order.status}, status=e.status_code)
     except Exception as e:
         return Response({'error': 'Failed to confirm delivery', 'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1014,9 +996,7 @@ def my_orders(request):
     if request.user.user_type != 'patient':
         return Response({'error': 'Patient access only'}, status=status.HTTP_403_FORBIDDEN)
 
-    orders = Order.objects.filter(patient=request.user).order_by('-created_at')
-    serializer = OrderSerializer(orders, many=True)
-    return Response(serializer.data)
+    return _list_orders(request, Order.objects.filter(patient=request.user))
 
 
 @api_view(['GET'])
@@ -1053,6 +1033,7 @@ def notification_mark_read(request, pk):
     return Response({'detail': 'marked read'})
 @api_view(['POST'])
 @permission_classes([IsAuthenticatedOrReadOnly])
+@idempotent
 def sell_medicine(request):
     """
     Expected JSON:
@@ -1069,19 +1050,16 @@ def sell_medicine(request):
         return Response({'detail': 'medicine_id and positive quantity required'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        med = Medicine.objects.select_for_update().get(id=med_id)
+        med = Medicine.objects.select_related('pharmacy').get(id=med_id)
     except Medicine.DoesNotExist:
         return Response({'detail': 'Medicine not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if med.stock_quantity < qty:
-        return Response({'detail': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
-
-    from .models import Pharmacy as InventoryPharmacy, Customer as InventoryCustomer
-
     with transaction.atomic():
 
-        med.stock_quantity = med.stock_quantity - qty
-        med.save()
+        try:
+            med.stock_quantity = stock.apply(deltas={med.id: -qty}, kind='sale')[med.id]
+        except stock.StockError:
+            return Response({'detail': 'Insufficient stock'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Use consistent helper to find/create a Customer record to avoid duplicates
         try:
@@ -1090,21 +1068,13 @@ def sell_medicine(request):
             customer_obj = None
 
     
+        # a pharmacy selling at its own counter books the sale to itself, anyone else to the medicine's owner
         inv_pharm = None
-        try:
-            if getattr(request, 'user', None) and getattr(request.user, 'user_type', '') == 'pharmacy':
-                inv_pharm = InventoryPharmacy.objects.filter(user=request.user).first()
-        except Exception:
-            inv_pharm = None
-
-        if not inv_pharm:
-            inv_pharm = InventoryPharmacy.objects.filter(user_id=getattr(med, 'pharmacy', None) and getattr(med.pharmacy, 'id', None)).first()
-
+        if getattr(request.user, 'user_type', '') == 'pharmacy':
+            inv_pharm = pharmacies.resolve(request.user, request, create=False)
         if not inv_pharm:
             try:
-                user_obj = med.pharmacy
-                uname = getattr(user_obj, 'name', None) or getattr(user_obj, 'username', None) or (getattr(user_obj, 'email', '') or '').split('@')[0]
-                inv_pharm, _ = InventoryPharmacy.objects.get_or_create(user_id=med.pharmacy.id, defaults={'name': f"{uname} Pharmacy", 'address': '', 'phone': ''})
+                inv_pharm = pharmacies.resolve(med.pharmacy, request)
             except Exception:
                 inv_pharm = None
 
@@ -1127,4 +1097,129 @@ def sell_medicine(request):
         'quantity': qty,
         'remaining_stock': med.stock_quantity,
     }
-    return Response(resp, status=status.HTTP_201_CREATED)
\ No newline at end of file
+    return Response(resp, status=status.HTTP_201_CREATED)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent
+def sell_basket(request):
+    """
+    Counter sale of several medicines at once, all or nothing.
+    Expected JSON:
+    { "items": [{"medicine_id": 1, "quantity": 2}, ...], "customer_name": "Name", "customer_phone": "0999..." }
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = BasketSaleSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+    lines = data['items']
+
+    # the same medicine scanned twice is one decrement but keeps its own Sale line
+    wanted = {}
+    for line in lines:
+        wanted[line['medicine_id']] = wanted.get(line['medicine_id'], 0) + line['quantity']
+
+    with transaction.atomic():
+        try:
+            remaining = stock.apply(deltas={pk: -qty for pk, qty in wanted.items()}, kind='sale', pharmacy=request.user)
+        except stock.StockError as e:
+            code = status.HTTP_404_NOT_FOUND if str(e) == 'Medicine not found' else status.HTTP_400_BAD_REQUEST
+            return Response({'error': str(e), 'medicine_ids': e.medicine_ids}, status=code)
+
+        prices = dict(Medicine.objects.filter(id__in=wanted).values_list('id', 'unit_price'))
+        customer = _get_or_create_customer(data.get('customer_name') or None, data.get('customer_email') or None, data.get('customer_phone') or None)
+        inv_pharm = pharmacies.resolve(request.user, request)
+        sales = Sale.objects.bulk_create([
+            Sale(pharmacy=inv_pharm, medicine_id=line['medicine_id'], quantity=line['quantity'],
+                 total_price=prices[line['medicine_id']] * line['quantity'], customer=customer)
+            for line in lines
+        ])
+
+    items = [
+        {'sale_id': sale.id, 'medicine_id': sale.medicine_id, 'quantity': sale.quantity, 'remaining_stock': remaining[sale.medicine_id]}
+        for sale in sales
+    ]
+    return Response({
+        'items': items,
+        'total': sum((sale.total_price for sale in sales), Decimal('0')),
+        'customer_id': customer.id if customer else None,
+    }, status=status.HTTP_201_CREATED)
+
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def sync_sales(request):
+    """
+    Upload sales rung up while the point of sale was offline.
+    Expected JSON:
+    { "sales": [{"client_id": "pos1-42", "medicine_id": 1, "quantity": 2, "sold_at": "2026-05-01T10:15:00Z",
+                 "customer_name": "Name", "customer_phone": "0999..."}, ...] }
+
+    Sales already synced (same client_id) are skipped, so a batch can be sent
+    again after a dropped connection. The rest are applied oldest first; a sale
+    the stock can no longer cover is reported as a conflict and the others still
+    go through. Stock, ledger and Sale rows are written with a fixed number of
+    statements whatever the batch size.
+    """
+    if request.user.user_type != 'pharmacy':
+        return Response({'error': 'Pharmacy access only'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = SaleSyncSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    batch, duplicates = {}, []
+    for sale in serializer.validated_data['sales']:
+        if sale['client_id'] in batch:
+            duplicates.append(sale['client_id'])
+        else:
+            batch[sale['client_id']] = sale
+
+    inv_pharm = pharmacies.resolve(request.user, request)
+    accepted, conflicts = [], []
+    with transaction.atomic():
+        # lock first: a concurrent upload of the same sales waits here, then sees them as synced
+        available = stock.lock({sale['medicine_id'] for sale in batch.values()}, pharmacy=request.user)
+        seen = set(
+            Sale.objects.filter(pharmacy=inv_pharm, client_id__in=list(batch)).values_list('client_id', flat=True)
+        )
+        duplicates.extend(sorted(seen))
+        taken = {}
+        for client_id, sale in sorted(batch.items(), key=lambda item: item[1]['sold_at']):
+            if client_id in seen:
+                continue
+            medicine_id = sale['medicine_id']
+            if medicine_id not in available:
+                conflicts.append({'client_id': client_id, 'medicine_id': medicine_id, 'quantity': sale['quantity'], 'error': 'Medicine not found'})
+                continue
+            left = available[medicine_id] - taken.get(medicine_id, 0)
+            if left < sale['quantity']:
+                conflicts.append({'client_id': client_id, 'medicine_id': medicine_id, 'quantity': sale['quantity'], 'available': left, 'error': 'Insufficient stock'})
+                continue
+            taken[medicine_id] = taken.get(medicine_id, 0) + sale['quantity']
+            accepted.append(sale)
+
+        remaining = stock.apply(deltas={pk: -qty for pk, qty in taken.items()}, kind='sale')
+        prices = dict(Medicine.objects.filter(id__in=taken).values_list('id', 'unit_price'))
+        customers = {}
+        for sale in accepted:
+            key = (sale.get('customer_name') or None, sale.get('customer_phone') or None)
+            if key != (None, None) and key not in customers:
+                customers[key] = _get_or_create_customer(key[0], None, key[1])
+        sales = Sale.objects.bulk_create([
+            Sale(pharmacy=inv_pharm, medicine_id=sale['medicine_id'], quantity=sale['quantity'],
+                 total_price=prices[sale['medicine_id']] * sale['quantity'], sale_date=sale['sold_at'],
+                 client_id=sale['client_id'],
+                 customer=customers.get((sale.get('customer_name') or None, sale.get('customer_phone') or None)))
+            for sale in accepted
+        ])
+
+    return Response({
+        'accepted': [{'client_id': sale.client_id, 'sale_id': sale.id} for sale in sales],
+        'duplicates': duplicates,
+        'conflicts': conflicts,
+        'stock': [{'medicine_id': pk, 'stock_quantity': qty} for pk, qty in sorted(remaining.items())],
+    })
\ No newline at end of file
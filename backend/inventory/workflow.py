@@ -0,0 +1,307 @@
+"""Order status transitions.
+
+Every status change made through the order endpoints goes through
+``transition``: it checks who may act and from which statuses, moves the
+status with a compare-and-set UPDATE against the status the order was loaded
+with (``Order._loaded_status``, recorded by ``Order.from_db``), runs the stock
+side effects in the same transaction and notifies the other party.
+
+    pending -> approved -> accepted -> shipped -> completed
+    pending/approved -> rejected
+
+``batch_transition`` applies one pharmacy action to many orders with a fixed
+number of statements, reporting the orders that could not move one by one.
+``release_expired`` cancels approved orders the patient never accepted, once
+their reservation is older than ``ORDER_RESERVATION_TTL``.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import pharmacies, stock
+from .models import Medicine, Notification, Order, OrderItem, Sale, StockMovement
+from .signals import _display_name
+
+
+class TransitionError(Exception):
+    """A transition was refused; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+Transition = namedtuple('Transition', 'sources target actor forbidden invalid')
+
+TRANSITIONS = {
+    'approve': Transition(('pending',), 'approved', 'pharmacy', 'Unauthorized', 'Only pending orders can be approved'),
+    'reject': Transition(('pending', 'approved'), 'rejected', 'pharmacy', 'Unauthorized', 'Order cannot be rejected at this stage'),
+    'ship': Transition(('approved', 'accepted'), 'shipped', 'pharmacy', 'Unauthorized', 'Only approved or patient-accepted orders can be marked shipped'),
+    'accept': Transition(('approved',), 'accepted', 'patient', 'Only the ordering patient can accept approval', 'Order must be in approved state to accept'),
+    'complete': Transition(('shipped', 'approved', 'delivered'), 'completed', 'pharmacy', 'Unauthorized', 'Only shipped, delivered or approved orders can be marked completed by pharmacy'),
+    'confirm': Transition(('shipped', 'delivered', 'completed'), 'completed', 'patient', 'Only the ordering patient can confirm delivery', "Order must be 'shipped', 'delivered' or 'completed' before confirming delivery"),
+}
+
+# pharmacy actions accepted by batch_transition, and how many orders one call may touch
+BATCH_ACTIONS = ('approve', 'reject', 'ship', 'complete')
+BATCH_LIMIT = 200
+
+
+def check(order, action, user):
+    """Raise TransitionError unless ``user`` may apply ``action`` to ``order`` now."""
+    t = TRANSITIONS[action]
+    party = order.pharmacy_id if t.actor == 'pharmacy' else order.patient_id
+    if party is None or getattr(user, 'pk', None) != party:
+        raise TransitionError(t.forbidden, 403)
+    if order.status not in t.sources:
+        raise TransitionError(t.invalid)
+    return t
+
+
+def _record_sales(order, customer):
+    """One Sale per order item, written in a single INSERT."""
+    try:
+        inv_pharm = pharmacies.resolve(order.pharmacy)
+    except Exception:
+        return
+    Sale.objects.bulk_create([
+        Sale(pharmacy=inv_pharm, medicine_id=medicine_id, quantity=quantity, total_price=subtotal, customer=customer)
+        for medicine_id, quantity, subtotal in OrderItem.objects.filter(order=order).values_list('medicine_id', 'quantity', 'subtotal')
+    ])
+
+
+def _side_effects(order, action, customer):
+    if action == 'approve':
+        stock.reserve(order)
+    elif action == 'reject':
+        stock.release(order)
+    elif action == 'confirm':
+        # orders approved earlier already hold their stock; otherwise take it now
+        stock.reserve(order, kind='sale')
+        _record_sales(order, customer)
+
+
+def notification_for(order, action, user):
+    """The (unsaved) Notification telling the other party about ``action``."""
+    if action in ('accept', 'confirm'):
+        if not order.pharmacy_id:
+            return None
+        if action == 'accept':
+            message = f'Patient {_display_name(user)} has accepted approval for order #{order.id}.'
+            return Notification(recipient_id=order.pharmacy_id, actor=user, verb='approval_accepted', message=message, data={'order_id': order.id})
+        customer_name = order.customer_name or _display_name(order.patient)
+        return Notification(
+            recipient_id=order.pharmacy_id,
+            actor_id=order.patient_id,
+            verb='order_confirmed_received',
+            message=f'Order #{order.id} was received by {customer_name}.',
+            data={'order_id': order.id, 'customer_name': customer_name},
+        )
+
+    if not order.patient_id:
+        return None
+    if action == 'reject':
+        return Notification(
+            recipient_id=order.patient_id,
+            actor=user,
+            verb='order_rejected',
+            message=f'Your order #{order.id} was rejected by the pharmacy. If you need help, please contact us.',
+            data={'order_id': order.id, 'contact_url': '/#contact'},
+        )
+    verb, text = {
+        'approve': ('order_approved', 'has been approved by'),
+        'ship': ('order_shipped', 'has been shipped by'),
+        'complete': ('order_completed_by_pharmacy', 'was marked completed by'),
+    }[action]
+    message = f'Your order #{order.id} {text} {_display_name(order.pharmacy)}.'
+    return Notification(recipient_id=order.patient_id, actor=user, verb=verb, message=message, data={'order_id': order.id})
+
+
+def transition(order, action, user, customer=None, customer_name=None):
+    """Apply ``action`` to ``order`` on behalf of ``user``.
+
+    ``customer`` and ``customer_name`` are only used by 'confirm', which
+    records the sale. Raises TransitionError (403, 400, or 409 if the order
+    changed since it was loaded, or 400 if stock ran short).
+    """
+    t = check(order, action, user)
+    changes = {'status': t.target, 'updated_at': timezone.now()}
+    if action == 'confirm' and customer_name:
+        changes['customer_name'] = customer_name
+
+    expected = order._loaded_status or order.status
+    try:
+        with transaction.atomic():
+            if not Order.objects.filter(pk=order.pk, status=expected).update(**changes):
+                raise TransitionError('Order was changed by another request; reload and try again', 409)
+            _side_effects(order, action, customer)
+    except stock.StockError as e:
+        raise TransitionError(str(e))
+    for field, value in changes.items():
+        setattr(order, field, value)
+    order._loaded_status = t.target
+
+    try:
+        note = notification_for(order, action, user)
+        if note is not None:
+            with transaction.atomic():
+                note.save()
+    except Exception:
+        pass
+    return order
+
+
+def _reserve_many(orders, failures):
+    """Reserve stock for ``orders`` in one locked pass; return the orders that got their stock.
+
+    Orders are served in the given order until a medicine runs short; orders
+    that cannot be covered are added to ``failures`` and hold nothing.
+    """
+    needs = defaultdict(dict)
+    rows = (
+        OrderItem.objects.filter(order_id__in=[o.pk for o in orders if not o.stock_reserved])
+        .values('order_id', 'medicine_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+        .values_list('order_id', 'medicine_id', 'total')
+    )
+    for order_id, medicine_id, total in rows:
+        needs[order_id][medicine_id] = total
+    available = stock.lock({medicine_id for need in needs.values() for medicine_id in need})
+
+    taken = defaultdict(int)
+    reserved, short, movements = [], {}, []
+    for order in orders:
+        need = {} if order.stock_reserved else needs.get(order.pk, {})
+        missing = [m for m, qty in need.items() if available.get(m, 0) - taken[m] < qty]
+        if missing:
+            short[order.pk] = missing
+            continue
+        for medicine_id, qty in need.items():
+            taken[medicine_id] += qty
+            movements.append(StockMovement(medicine_id=medicine_id, kind='reservation', quantity=-qty, order=order))
+        reserved.append(order)
+
+    if short:
+        names = dict(Medicine.objects.filter(id__in={m for missing in short.values() for m in missing}).values_list('id', 'name'))
+        for pk, missing in short.items():
+            failures[pk] = TransitionError(f'Insufficient stock for {", ".join(names.get(m, str(m)) for m in sorted(missing))}')
+    if taken:
+        stock.apply(deltas={medicine_id: -qty for medicine_id, qty in taken.items()}, movements=movements)
+    return reserved
+
+
+def _release_many(orders):
+    reserved = {o.pk: o for o in orders if o.stock_reserved}
+    if not reserved:
+        return
+    rows = (
+        OrderItem.objects.filter(order_id__in=reserved)
+        .values('order_id', 'medicine_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+        .values_list('order_id', 'medicine_id', 'total')
+    )
+    deltas, movements = defaultdict(int), []
+    for order_id, medicine_id, total in rows:
+        deltas[medicine_id] += total
+        movements.append(StockMovement(medicine_id=medicine_id, kind='release', quantity=total, order=reserved[order_id]))
+    stock.apply(deltas=deltas, movements=movements)
+
+
+def batch_transition(order_ids, action, user):
+    """Apply ``action`` (one of BATCH_ACTIONS) to many orders at once.
+
+    Returns ``(succeeded_ids, failures)``; ``failures`` maps order id to the
+    TransitionError that order would have got on its own. Orders are locked,
+    updated and notified with a fixed number of statements.
+    """
+    t = TRANSITIONS[action]
+    failures = {}
+    with transaction.atomic():
+        found = {
+            order.pk: order
+            for order in Order.objects.select_for_update(of=('self',)).select_related('pharmacy', 'patient')
+            .filter(pk__in=order_ids).order_by('id')
+        }
+        eligible = []
+        for pk in dict.fromkeys(order_ids):
+            order = found.get(pk)
+            if order is None:
+                failures[pk] = TransitionError('Order not found', 404)
+                continue
+            try:
+                check(order, action, user)
+            except TransitionError as e:
+                failures[pk] = e
+                continue
+            eligible.append(order)
+
+        if action == 'approve':
+            eligible = _reserve_many(eligible, failures)
+        elif action == 'reject':
+            _release_many(eligible)
+
+        changes = {'status': t.target, 'updated_at': timezone.now()}
+        if action in ('approve', 'reject'):
+            changes['stock_reserved'] = action == 'approve'
+        if eligible:
+            Order.objects.filter(pk__in=[order.pk for order in eligible]).update(**changes)
+        for order in eligible:
+            for field, value in changes.items():
+                setattr(order, field, value)
+            order._loaded_status = t.target
+
+    try:
+        notes = [note for note in (notification_for(order, action, user) for order in eligible) if note is not None]
+        Notification.objects.bulk_create(notes)
+    except Exception:
+        pass
+    return [order.pk for order in eligible], failures
+
+
+def release_expired(ttl=None, chunk_size=200):
+    """Cancel approved orders whose reservation is older than ``ttl`` seconds.
+
+    Works a chunk of orders at a time: each chunk is locked, its stock put back
+    and its status changed with a fixed number of statements, and the patients
+    are notified in one INSERT. Returns the number of orders cancelled.
+    """
+    ttl = settings.ORDER_RESERVATION_TTL if ttl is None else ttl
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    total = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update(of=('self',)).select_related('pharmacy')
+                .filter(status='approved', stock_reserved=True, updated_at__lt=cutoff)
+                .order_by('updated_at', 'id')[:chunk_size]
+            )
+            if not orders:
+                break
+            _release_many(orders)
+            Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+                status='cancelled', stock_reserved=False, updated_at=timezone.now(),
+            )
+        total += len(orders)
+
+        try:
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=order.patient_id,
+                    actor_id=order.pharmacy_id,
+                    verb='order_reservation_expired',
+                    message=f'Your order #{order.id} from {_display_name(order.pharmacy)} was cancelled because the approval was not accepted in time.',
+                    data={'order_id': order.id},
+                )
+                for order in orders if order.patient_id
+            ])
+        except Exception:
+            pass
+        if len(orders) < chunk_size:
+            break
+    return total
@@ -2,6 +2,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from inventory.models import Medicine
+from inventory.search import search as search_medicines
 from .models import Pharmacy
 from django.contrib.auth.models import User
 import math
@@ -17,20 +18,9 @@ class SearchMedicineView(APIView):
         if not medicine_name:
             return Response({"error": "Medicine name required"}, status=400)
 
-        today = timezone.localdate()
+        base_qs = Medicine.objects.available_for_patient()
 
-        # Prefer a centralized manager if present, otherwise apply inline filter
-        if hasattr(Medicine.objects, "available_for_patient"):
-            base_qs = Medicine.objects.available_for_patient()
-        else:
-            # stock_quantity > 0 and not expired (expiry_date is null OR expiry_date >= today)
-            base_qs = Medicine.objects.filter(
-                stock_quantity__gt=0
-            ).filter(
-                Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
-            )
-
-        medicines_qs = base_qs.filter(name__icontains=medicine_name).select_related('pharmacy')
+        medicines_qs = search_medicines(base_qs, medicine_name, fields=('name',)).select_related('pharmacy')
 
         results = []
         seen_pharmacies = set()
@@ -96,7 +86,6 @@ class NearbyPharmaciesView(APIView):
         
         pharmacies = Pharmacy.objects.all()
         
-        today = timezone.localdate()
         nearby = []
         for pharmacy in pharmacies:
             # Skip pharmacies without coordinates
@@ -104,12 +93,7 @@ class NearbyPharmaciesView(APIView):
                 continue
 
             # Only include pharmacies that have at least one in-stock, non-expired medicine
-            has_available = Medicine.objects.filter(
-                pharmacy=pharmacy,
-                stock_quantity__gt=0
-            ).filter(
-                Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
-            ).exists()
+            has_available = Medicine.objects.available_for_patient().filter(pharmacy=pharmacy).exists()
 
             if not has_available:
                 # behave like patient UI: don't show pharmacies with only out-of-stock or expired items
@@ -118,12 +102,7 @@ class NearbyPharmaciesView(APIView):
             distance = self.calculate_distance(lat, lng, pharmacy.latitude, pharmacy.longitude)
             if distance <= radius:
                 # optionally include a count of available medicines for display
-                available_count = Medicine.objects.filter(
-                    pharmacy=pharmacy,
-                    stock_quantity__gt=0
-                ).filter(
-                    Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
-                ).count()
+                available_count = Medicine.objects.available_for_patient().filter(pharmacy=pharmacy).count()
 
                 nearby.append({
                     "id": pharmacy.id,
@@ -105,6 +105,38 @@ if DATABASE_URL and dj_database_url is not None:
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://127.0.0.1:27017')
 MONGODB_DB = os.getenv('MONGODB_DB', 'pharmatrack')
 
+# Seconds before a worker reloads its in-memory pharmacy location index
+PHARMACY_INDEX_TTL = int(os.getenv('PHARMACY_INDEX_TTL', '300'))
+
+# Catalogue response cache. Uses the default local-memory cache unless a shared
+# backend is configured, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and CACHE_LOCATION=redis://host:6379/1
+if os.getenv('CACHE_BACKEND'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.getenv('CACHE_BACKEND'),
+            'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        }
+    }
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv('CATALOGUE_CACHE_TIMEOUT', '60'))
+CATALOGUE_CACHE_TILE_DEGREES = float(os.getenv('CATALOGUE_CACHE_TILE_DEGREES', '0.02'))
+
+# Seconds a stored Idempotency-Key response is replayed; purge_idempotency_keys deletes older ones
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+# Seconds after which a claimed key with no stored response (its worker died) may be retried
+IDEMPOTENCY_LEASE = int(os.getenv('IDEMPOTENCY_LEASE', '120'))
+
+# Email outbox (manage.py run_outbox): attempts per email, and the first retry delay in
+# seconds, doubled after every failure
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', '60'))
+# Seconds a worker holds a batch it is sending; unsent rows become due again after that
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', '300'))
+
+# Seconds an approved order holds its stock waiting for the patient to accept;
+# manage.py release_expired_reservations cancels older ones and returns the stock
+ORDER_RESERVATION_TTL = int(os.getenv('ORDER_RESERVATION_TTL', '172800'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},